@@ -1,21 +1,45 @@
 import gradio as gr
-from together import Together
-import base64
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse
+import uvicorn
 from PIL import Image
-import io
 import logging
-import requests
+import httpx
+import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
 import os
-import json
-import psycopg2
-from psycopg2 import Error
+import atexit
+import queue
+import ipaddress
+import threading
 from urllib.parse import urlparse
+import functools
 from functools import lru_cache
+from concurrent.futures import TimeoutError as FutureTimeoutError, as_completed
 import time
-from typing import Tuple, Any, Optional
+from typing import TYPE_CHECKING, Tuple, Any, Optional, List, Callable, Iterable
 import genarationData
+from cache import ResultCache
+from image_payload import GeneratedImage
+from raw_response import encode_response
+from persistence import PersistenceJob, PersistenceQueue
+from scheduler import AdmissionController, AdmissionRejected
+from resilience import CircuitBreaker, retry_with_backoff, async_retry_with_backoff, breaker_states, retry_counts
+import metrics
+from metrics import observe
+
+if TYPE_CHECKING:
+    # Heavy dependencies are imported where they are first used to keep cold start fast.
+    import requests
+    from together import AsyncTogether
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from batch_writer import BatchWriter
+    from db_pool import ConnectionPool
+    from gallery import GalleryReader
+    from storage import StorageBackend
+
+STARTED_AT = time.monotonic()
 
 # Load environment variables
 load_dotenv()
@@ -27,9 +51,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Together client
+# Together client settings; the client itself is created on first use.
+# SDK retries are disabled: resilience.py is the only retry policy, so attempts do not
+# multiply and the breaker and Retry-After handling see every failure.
 api_key = os.getenv("TOGETHER_API_KEY")
-client = Together(api_key=api_key)
+together_base_url = os.getenv("TOGETHER_BASE_URL")  # None selects the SDK default
 
 # Configuration constants
 IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
@@ -40,6 +66,93 @@ CACHE_TIMEOUT = 3600
 MAX_RETRIES = 3
 RETRY_DELAY = 1
 
+IMGBB_UPLOAD_URL = os.getenv("IMGBB_UPLOAD_URL", "https://api.imgbb.com/1/upload")
+IMGBB_TIMEOUT = 30
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# One circuit breaker per upstream, shared by the sync and async call paths
+together_breaker = CircuitBreaker("Together", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+imgbb_breaker = CircuitBreaker("ImgBB", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+metrics.stats_collector.register(
+    "breaker", breaker_states, counters=('opened', 'rejected', 'successes', 'failures'), label="upstream",
+)
+metrics.stats_collector.register(
+    "upstream", lambda: {name: {'retries': count} for name, count in retry_counts().items()},
+    counters=('retries',), label="upstream",
+)
+retry_imgbb = retry_with_backoff(imgbb_breaker, MAX_RETRIES, RETRY_DELAY, RETRY_MAX_DELAY)
+async_retry_imgbb = async_retry_with_backoff(imgbb_breaker, MAX_RETRIES, RETRY_DELAY, RETRY_MAX_DELAY)
+async_retry_together = async_retry_with_backoff(together_breaker, MAX_RETRIES, RETRY_DELAY, RETRY_MAX_DELAY)
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "100"))
+DB_BATCH_MAX_DELAY = float(os.getenv("DB_BATCH_MAX_DELAY", "0.5"))
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "cache")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(CACHE_TIMEOUT)))
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv("RESULT_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "8"))
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "64"))
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "120"))
+SCHEDULER_RATE_PER_MINUTE = float(os.getenv("SCHEDULER_RATE_PER_MINUTE", "6"))
+SCHEDULER_BURST = float(os.getenv("SCHEDULER_BURST", "3"))
+SCHEDULER_MAX_PER_CLIENT = int(os.getenv("SCHEDULER_MAX_PER_CLIENT", "2"))
+# Comma-separated proxy addresses/CIDRs whose X-Forwarded-For is believed; empty trusts no one
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.getenv("TRUSTED_PROXIES", "").split(",") if entry.strip()
+]
+QUEUE_STATUS_INTERVAL = 1.0
+
+STATUS_POLL_INTERVAL = 0.25
+STREAM_STATUS_TIMEOUT = float(os.getenv("STREAM_STATUS_TIMEOUT", "60"))
+
+MAX_BATCH_SIZE = 4
+PROVIDER_MAX_N = int(os.getenv("PROVIDER_MAX_N", "4"))
+
+PERSISTENCE_WORKERS = int(os.getenv("PERSISTENCE_WORKERS", "4"))
+PERSISTENCE_QUEUE_SIZE = int(os.getenv("PERSISTENCE_QUEUE_SIZE", "100"))
+PERSISTENCE_ENQUEUE_TIMEOUT = float(os.getenv("PERSISTENCE_ENQUEUE_TIMEOUT", "2"))
+PERSISTENCE_SPOOL_DIR = os.getenv("PERSISTENCE_SPOOL_DIR", "spool")
+
+# Where images are stored: "imgbb" or "local" (served by this app under LOCAL_STORAGE_PATH)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "imgbb").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "media")
+LOCAL_STORAGE_PATH = "/media"
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL", LOCAL_STORAGE_PATH)
+
+# Thumbnail and preview WebP renditions for backends that do not make their own (ImgBB does),
+# rendered in worker processes after the row is saved
+GENERATE_DERIVATIVES = os.getenv("GENERATE_DERIVATIVES", "True").lower() == "true"
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", "2"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "384"))
+PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", "1024"))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+DERIVATIVE_TIMEOUT = 60
+
+# Keep the full ImgBB response in generated_image_responses; set False to drop it
+STORE_RAW_RESPONSES = os.getenv("STORE_RAW_RESPONSES", "True").lower() == "true"
+
+GALLERY_CACHE_TTL = float(os.getenv("GALLERY_CACHE_TTL", "10"))
+GALLERY_CACHE_SIZE = int(os.getenv("GALLERY_CACHE_SIZE", "256"))
+GALLERY_MAX_PAGE_SIZE = int(os.getenv("GALLERY_MAX_PAGE_SIZE", "100"))
+
+# "background" migrates after the server starts, "blocking" before, "skip" never
+SCHEMA_INIT = os.getenv("SCHEMA_INIT", "background").lower()
+
+# Set once the schema is known to be current; /readyz reports not ready until then.
+schema_ready = threading.Event()
+
 @lru_cache(maxsize=1)
 def get_db_config() -> dict:
     """Parse PostgreSQL URL and return connection configuration."""
@@ -50,155 +163,595 @@ def get_db_config() -> dict:
         'password': parsed.password,
         'database': parsed.path.strip('/'),
         'port': parsed.port,
+        # Bounds how long an outage can stall a connect on the pool or the batch writer thread.
+        'connect_timeout': DB_CONNECT_TIMEOUT,
     }
 
-def get_db_connection() -> psycopg2.extensions.connection:
-    """Establish a connection to the PostgreSQL database with retry logic."""
-    for attempt in range(MAX_RETRIES):
-        try:
-            config = get_db_config()
-            connection = psycopg2.connect(**config)
-            if connection:
-                logger.info('Successfully connected to PostgreSQL database')
-                return connection
-        except Error as e:
-            if attempt == MAX_RETRIES - 1:
-                logger.error(f"Final attempt failed to connect to PostgreSQL: {e}")
-                raise
-            time.sleep(RETRY_DELAY)
-    raise Exception("Failed to connect to database after retries")
+@lru_cache(maxsize=1)
+def get_db_pool() -> "ConnectionPool":
+    """Create the shared PostgreSQL connection pool on first use."""
+    from db_pool import ConnectionPool
+    pool = ConnectionPool(
+        get_db_config(),
+        minconn=DB_POOL_MIN,
+        maxconn=DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+    )
+    metrics.stats_collector.register(
+        "db_pool", pool.stats,
+        counters=('checkouts', 'timeouts', 'connects', 'reconnects', 'discarded', 'wait_time_total'),
+    )
+    return pool
 
 def init_db():
-    """Initialize the database schema if it doesn't exist."""
+    """Bring the database schema up to date through the versioned migrations."""
+    from psycopg2 import Error
+    import migrations
     try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS generated_images (
-                    id SERIAL PRIMARY KEY,
-                    generation_prompt TEXT NOT NULL,
-                    generation_timestamp TIMESTAMP NOT NULL,
-                    generation_width INT NOT NULL,
-                    generation_height INT NOT NULL,
-                    generation_steps INT NOT NULL,
-                    imgbb_id VARCHAR(255) NOT NULL,
-                    imgbb_title VARCHAR(255),
-                    imgbb_url_viewer TEXT,
-                    imgbb_url TEXT,
-                    imgbb_display_url TEXT,
-                    imgbb_width VARCHAR(50),
-                    imgbb_height VARCHAR(50),
-                    imgbb_size VARCHAR(50),
-                    imgbb_time VARCHAR(50),
-                    imgbb_expiration VARCHAR(50),
-                    delete_url TEXT,
-                    raw_response TEXT,
-                    user_id VARCHAR(255)
-                );
-                ''')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON generated_images (generation_timestamp);')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_imgbb_id ON generated_images (imgbb_id);')
-            connection.commit()
-            logger.info("Database initialized successfully")
+        applied = migrations.migrate(get_db_pool())
     except Error as e:
         logger.error(f"Error initializing database: {e}")
         raise
+    if applied:
+        logger.info(f"Applied schema migration(s) {applied}")
+    else:
+        logger.info("Database schema is up to date")
+    schema_ready.set()
 
-def retry_with_backoff(func):
-    """Decorator for functions to retry with exponential backoff."""
-    def wrapper(*args, **kwargs):
-        for i in range(MAX_RETRIES):
+def init_db_in_background() -> threading.Thread:
+    """Run ``init_db`` off the startup path, retrying until the database is reachable."""
+    def run():
+        delay = RETRY_DELAY
+        while True:
             try:
-                return func(*args, **kwargs)
+                init_db()
+                logger.info(f"Ready to serve {time.monotonic() - STARTED_AT:.2f}s after start")
+                return
             except Exception as e:
-                if i == MAX_RETRIES - 1:
-                    raise
-                wait = (2 ** i) * RETRY_DELAY
-                logger.warning(f"Attempt {i+1} failed, retrying in {wait} seconds...")
-                time.sleep(wait)
-    return wrapper
-
-@retry_with_backoff
-def upload_to_imgbb(image_bytes: bytes) -> dict:
-    """Upload image to ImgBB and return the response."""
-    img_base64 = base64.b64encode(image_bytes).decode('utf-8')
-    url = "https://api.imgbb.com/1/upload"
-    payload = {
-        "key": IMGBB_API_KEY,
-        "image": img_base64
-    }
-    response = requests.post(url, payload, timeout=30)
-    response.raise_for_status()
+                logger.warning(f"Schema initialization failed, retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    thread = threading.Thread(target=run, name="schema-init", daemon=True)
+    thread.start()
+    return thread
+
+@lru_cache(maxsize=1)
+def get_async_together_client() -> "AsyncTogether":
+    """Create the async Together client on first use."""
+    from together import AsyncTogether
+    return AsyncTogether(api_key=api_key, base_url=together_base_url, max_retries=0)
+
+@lru_cache(maxsize=1)
+def get_http_session() -> "requests.Session":
+    """Return a shared keep-alive session for synchronous uploads."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@lru_cache(maxsize=1)
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return a shared keep-alive async HTTP client for uploads."""
+    return httpx.AsyncClient(
+        timeout=IMGBB_TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+    )
+
+@retry_imgbb
+def upload_to_imgbb(image: GeneratedImage) -> dict:
+    """Upload image to ImgBB as multipart form data and return the response."""
+    with observe('imgbb_upload'):
+        response = get_http_session().post(
+            IMGBB_UPLOAD_URL,
+            data={"key": IMGBB_API_KEY},
+            files={"image": image.upload_part()},
+            timeout=IMGBB_TIMEOUT,
+        )
+        response.raise_for_status()
+    logger.info("Successfully uploaded to ImgBB")
+    return response.json()
+
+@async_retry_imgbb
+async def upload_to_imgbb_async(image: GeneratedImage) -> dict:
+    """Upload image to ImgBB over the shared async client and return the response."""
+    with observe('imgbb_upload'):
+        response = await get_async_http_client().post(
+            IMGBB_UPLOAD_URL,
+            data={"key": IMGBB_API_KEY},
+            files={"image": image.upload_part()},
+        )
+        response.raise_for_status()
     logger.info("Successfully uploaded to ImgBB")
     return response.json()
 
-@retry_with_backoff
-def generate_image(prompt: str, width: int, height: int, steps: int) -> Tuple[Image.Image, bytes]:
-    """Generate an image using the Together API."""
+@lru_cache(maxsize=1)
+def get_storage() -> "StorageBackend":
+    """Create the configured image storage backend on first use."""
+    from storage import ImgBBStorage, LocalStorage
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL)
+    if STORAGE_BACKEND != "imgbb":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return ImgBBStorage(upload_to_imgbb, upload_to_imgbb_async)
+
+@lru_cache(maxsize=1)
+def get_derivative_pool() -> "ProcessPoolExecutor":
+    """Start the worker processes that render derivatives, on first use."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # spawn, not fork: forking a process that already runs threads can deadlock the child.
+    return ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+@lru_cache(maxsize=1)
+def get_derivative_threads() -> "ThreadPoolExecutor":
+    """Threads that wait on rendering, store the results and record their URLs."""
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS, thread_name_prefix="derivatives")
+
+UPDATE_DERIVATIVES_SQL = 'UPDATE generated_images SET thumbnail_url = %s, preview_url = %s WHERE imgbb_id = %s'
+
+def save_derivative_urls(image_id: str, urls: dict):
+    """Fill in the derivative URLs of an already saved row."""
+    with get_db_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(UPDATE_DERIVATIVES_SQL, (urls.get('thumbnail'), urls.get('preview'), image_id))
+        connection.commit()
+
+def render_derivatives(image_id: str, image_b64: str):
+    """Render, store and record the thumbnail and preview of one saved image; runs on the derivative threads."""
+    from derivatives import make_derivatives
+    try:
+        with observe('derivatives'):
+            renditions = get_derivative_pool().submit(
+                make_derivatives, GeneratedImage.from_b64(image_b64).data,
+                {'thumbnail': THUMBNAIL_SIZE, 'preview': PREVIEW_SIZE}, WEBP_QUALITY,
+            ).result(timeout=DERIVATIVE_TIMEOUT)
+            urls = {kind: get_storage().put_derivative(image_id, kind, data, extension)
+                    for kind, (data, extension) in renditions.items()}
+            save_derivative_urls(image_id, urls)
+    except Exception as e:
+        # Best effort: the row already points at the full-size image, which the gallery falls back to.
+        logger.warning(f"Could not create derivatives for {image_id}: {e}")
+
+def submit_derivatives(saved: Iterable[Tuple[dict, str, Optional[dict]]]):
+    """Queue rendering for saved ``(response, image_b64, derivative_urls)`` whose backend made no renditions."""
+    if not GENERATE_DERIVATIVES:
+        return
+    for response, image_b64, urls in saved:
+        if urls is None:
+            get_derivative_threads().submit(render_derivatives, response['data'].get('id'), image_b64)
+
+def _generation_params(prompt: str, width: int, height: int, steps: int, n: int = 1) -> dict:
     if not prompt.strip():
         raise ValueError("Please enter a prompt")
-    
-    logger.info(f"Generating image with parameters: width={width}, height={height}, steps={steps}")
-    response = client.images.generate(
-        prompt=prompt,
-        model="black-forest-labs/FLUX.1-schnell-Free",
-        width=width,
-        height=height,
-        steps=steps,
-        n=1,
-        response_format="b64_json"
+    logger.info(f"Generating image with parameters: width={width}, height={height}, steps={steps}, n={n}")
+    return {
+        "prompt": prompt,
+        "model": "black-forest-labs/FLUX.1-schnell-Free",
+        "width": width,
+        "height": height,
+        "steps": steps,
+        "n": n,
+        "response_format": "b64_json",
+    }
+
+def _decode_generation(response) -> List[GeneratedImage]:
+    logger.info(f"Generated {len(response.data)} image(s) successfully")
+    return [GeneratedImage.from_b64(item.b64_json) for item in response.data]
+
+def _split_batch(count: int) -> List[int]:
+    """Split a batch into per-call sizes the provider accepts."""
+    full, rest = divmod(count, PROVIDER_MAX_N)
+    return [PROVIDER_MAX_N] * full + ([rest] if rest else [])
+
+@async_retry_together
+async def generate_images_async(prompt: str, width: int, height: int, steps: int, n: int = 1) -> List[GeneratedImage]:
+    """Generate ``n`` variations in one call using the async Together client."""
+    params = _generation_params(prompt, width, height, steps, n)
+    with observe('together_inference'):
+        response = await get_async_together_client().images.generate(**params)
+    return _decode_generation(response)
+
+@lru_cache(maxsize=1)
+def get_upload_threads() -> "ThreadPoolExecutor":
+    """Threads that upload the images of a persistence job concurrently."""
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=PERSISTENCE_WORKERS * MAX_BATCH_SIZE, thread_name_prefix="upload")
+
+def persist_generation(job: PersistenceJob, report) -> List[Optional[str]]:
+    """Upload a batch of generated images and record them; runs on a persistence worker."""
+    total = len(job.images_b64)
+    # Upload concurrently, like the inline path, so a batch costs one upload latency rather than one per image.
+    pending = [i for i, response in enumerate(job.upload_responses) if response is None]
+    if pending:
+        report(f'uploading 0/{len(pending)}' if len(pending) > 1 else 'uploading')
+        futures = {get_upload_threads().submit(get_storage().upload, GeneratedImage.from_b64(job.images_b64[i])): i
+                   for i in pending}
+        errors = []
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                # Kept on the job, so a retry only uploads the images that failed.
+                job.upload_responses[futures[future]] = future.result()
+            except Exception as e:
+                errors.append(e)
+            if len(pending) > 1:
+                report(f'uploading {done}/{len(pending)}')
+        if errors:
+            raise errors[0]
+    report('saving')
+    # A retry only inserts the rows an earlier attempt did not commit.
+    pending = [i for i, saved in enumerate(job.saved) if not saved]
+    responses = [job.upload_responses[i] for i in pending]
+    derivative_urls = [get_storage().derivative_urls(response) for response in responses]
+    results = save_batch_to_database(job.prompt, job.width, job.height, job.steps, responses, derivative_urls)
+    for i, saved in zip(pending, results):
+        job.saved[i] = saved
+    # Rendered after the insert so the job reports "saved" without waiting on it.
+    submit_derivatives((response, job.images_b64[i], urls)
+                       for i, response, urls in zip(pending, responses, derivative_urls) if job.saved[i])
+    if not all(job.saved):
+        raise RuntimeError(f"Database save failed for {job.saved.count(False)} of {total} image(s)")
+    return [response['data'].get('url') for response in job.upload_responses]
+
+@lru_cache(maxsize=1)
+def get_persistence_queue() -> PersistenceQueue:
+    """Create and start the background persistence queue on first use."""
+    persistence_queue = PersistenceQueue(
+        persist_generation,
+        PERSISTENCE_SPOOL_DIR,
+        maxsize=PERSISTENCE_QUEUE_SIZE,
+        workers=PERSISTENCE_WORKERS,
+        enqueue_timeout=PERSISTENCE_ENQUEUE_TIMEOUT,
+    )
+    persistence_queue.start()
+    metrics.stats_collector.register("persistence", lambda: {'pending': persistence_queue.pending()})
+    return persistence_queue
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> ResultCache:
+    """Create the shared generated-image cache on first use."""
+    cache = ResultCache(
+        RESULT_CACHE_DIR or None,
+        ttl=RESULT_CACHE_TTL,
+        memory_bytes=RESULT_CACHE_MEMORY_BYTES,
+        disk_bytes=RESULT_CACHE_DISK_BYTES,
+    )
+    metrics.stats_collector.register(
+        "result_cache", cache.stats,
+        counters=('memory_hits', 'disk_hits', 'misses', 'evictions', 'expired'),
     )
-    
-    image_bytes = base64.b64decode(response.data[0].b64_json)
-    image = Image.open(io.BytesIO(image_bytes))
-    
-    logger.info("Image generated successfully")
-    return image, image_bytes
-
-def handle_generation(prompt: str, width: int, height: int, steps: int) -> Tuple[Optional[Image.Image], str]:
-    """Handle the entire process of image generation, upload, and database save."""
+    return cache
+
+JOB_STATE_MESSAGES = {
+    'queued': "Waiting for an upload slot...",
+    'uploading': "Uploading to storage...",
+    'saving': "Saving to the gallery database...",
+    'retrying': "Saving hit an error, retrying...",
+}
+
+def format_status(message: str, timings: dict) -> str:
+    """Append per-stage timings (in seconds) to a status message."""
+    if not timings:
+        return message
+    return message + "\nTimings: " + " | ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
+
+def describe_job(job_id: str, status: dict, timings: dict) -> Tuple[str, bool]:
+    """Turn a persistence job status into a user-facing message; also report whether it is final."""
+    state = status['state']
+    timings = {**timings, **status['timings']}
+    if state == 'done':
+        urls = [url for url in status.get('urls') or [] if url]
+        return format_status("Saved to the gallery!" + "".join(f"\n{url}" for url in urls), timings), True
+    if state == 'failed':
+        return format_status(f"Image generated, but saving to the gallery failed (job {job_id}): {status.get('error')}", timings), True
+    stage, _, progress = state.partition(' ')
+    message = JOB_STATE_MESSAGES.get(stage, state)
+    if progress:
+        message = f"{message} ({progress})"
+    return format_status(message, timings), False
+
+async def follow_persistence(job_id: str, images: list, timings: dict):
+    """Yield a status update whenever a background persistence job changes state."""
+    deadline = time.monotonic() + STREAM_STATUS_TIMEOUT
+    last_state = None
+    while time.monotonic() < deadline:
+        status = get_persistence_queue().status(job_id)
+        if status is None:
+            break
+        if status['state'] != last_state:
+            last_state = status['state']
+            message, finished = describe_job(job_id, status, timings)
+            yield images, message
+            if finished:
+                return
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+    yield images, format_status(f"Still saving to the gallery in the background (job {job_id}).", timings)
+
+async def handle_generation_async(prompt: str, width: int, height: int, steps: int, fresh: bool = False,
+                                  count: int = 1, style: str = genarationData.DEFAULT_STYLE,
+                                  on_generated: Optional[Callable[[], None]] = None):
+    """Generate ``count`` images without blocking the event loop.
+
+    Yields the gallery as each image is decoded, then a status update for every
+    upload/persistence stage, with per-stage timings. ``on_generated`` is
+    called once no more provider calls will be made.
+    """
+    images: List[Image.Image] = []
+    timings = {}
+    error = None
+    request_span = metrics.start_span("generation_request", width=width, height=height, steps=steps, count=count)
+    metrics.IN_FLIGHT.inc()
     try:
-        image, image_bytes = generate_image(prompt, width, height, steps)
-        imgbb_response = upload_to_imgbb(image_bytes)
-        if save_to_database(prompt, width, height, steps, imgbb_response):
-            return image, "Image generated successfully!"
+        count = max(1, min(int(count), MAX_BATCH_SIZE))
+        prompt = genarationData.apply_style(style, prompt)
+        started = time.perf_counter()
+        cache = get_result_cache()
+        missing_keys = []
+        for variant in range(count):
+            cache_key = ResultCache.key(prompt, width, height, steps, variant)
+            cached_bytes = None if fresh else await asyncio.to_thread(cache.get, cache_key)
+            if cached_bytes is None:
+                missing_keys.append(cache_key)
+            else:
+                images.append(GeneratedImage.from_bytes(cached_bytes).image)
+        timings['cache'] = time.perf_counter() - started
+        # A hit only means an identical request generated the image earlier; the cache is
+        # filled before persistence, so that copy may still be saving or may have failed to.
+        if not missing_keys:
+            yield images, ("Image(s) served from cache of an earlier identical request; not saved to the gallery again. "
+                           "Tick \"Fresh sample\" for new variations.")
+            return
+        if images:
+            yield list(images), format_status(f"{len(images)} of {count} image(s) served from cache (not saved again), "
+                                              f"generating the rest...", timings)
+
+        # One call per provider-sized chunk; the calls run concurrently and each
+        # chunk is shown as soon as it lands.
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(generate_images_async(prompt, width, height, steps, n))
+                 for n in _split_batch(len(missing_keys))]
+        generated: List[GeneratedImage] = []
+        failures = []
+        timings['decode'] = 0.0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    batch = await next_done
+                except Exception as e:
+                    failures.append(e)
+                    continue
+                timings['generate'] = time.perf_counter() - started
+                fresh_items = batch[:len(missing_keys) - len(generated)]
+                keys = missing_keys[len(generated):len(generated) + len(fresh_items)]
+                for item in fresh_items:
+                    decode_started = time.perf_counter()
+                    images.append(item.image)
+                    timings['decode'] += time.perf_counter() - decode_started
+                    generated.append(item)
+                yield list(images), format_status(f"Generated {len(images)} of {count} image(s)...", timings)
+                # Only after the yield: a disk-cache write of a multi-MB PNG must not delay the preview.
+                for key, item in zip(keys, fresh_items):
+                    await asyncio.to_thread(cache.put, key, item.data)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if on_generated is not None:
+                on_generated()
+        if failures and not generated:
+            raise failures[0]
+        if failures:
+            yield list(images), format_status(f"{len(failures)} generation request(s) failed: {failures[0]}", timings)
+
+        try:
+            job_id = await asyncio.to_thread(get_persistence_queue().submit, prompt, width, height, steps,
+                                             [item.b64 for item in generated])
+        except queue.Full:
+            logger.warning("Persistence queue is full, saving inline")
+        else:
+            async for update in follow_persistence(job_id, images, timings):
+                yield update
+            return
+        yield images, format_status(f"Uploading to {get_storage().name}...", timings)
+        started = time.perf_counter()
+        imgbb_responses = await asyncio.gather(*(get_storage().upload_async(item) for item in generated))
+        timings['upload'] = time.perf_counter() - started
+        yield images, format_status("Saving to the gallery database...", timings)
+        started = time.perf_counter()
+        derivative_urls = [get_storage().derivative_urls(response) for response in imgbb_responses]
+        results = await asyncio.to_thread(save_batch_to_database, prompt, width, height, steps, imgbb_responses,
+                                          derivative_urls)
+        saved = all(results)
+        submit_derivatives((response, item.b64, urls) for response, item, urls, ok
+                           in zip(imgbb_responses, generated, derivative_urls, results) if ok)
+        timings['save'] = time.perf_counter() - started
+        if saved:
+            urls = "".join(f"\n{response['data'].get('url')}" for response in imgbb_responses)
+            yield images, format_status(f"Saved to the gallery!{urls}", timings)
         else:
-            return image, "Image generated and uploaded, but database save failed!"
+            yield images, format_status("Image(s) generated and uploaded, but database save failed!", timings)
     except Exception as e:
-        logger.error(f"Error in handle_generation: {str(e)}")
-        return None, f"Error: {str(e)}"
+        error = e
+        metrics.ERRORS.labels('request').inc()
+        logger.error(f"Error in handle_generation_async: {str(e)}")
+        yield images or None, format_status(f"Error: {str(e)}", timings)
+    finally:
+        metrics.IN_FLIGHT.dec()
+        metrics.end_span(request_span, error)
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    """Create the admission controller guarding the generate endpoint."""
+    controller = AdmissionController(
+        max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+        max_queue=SCHEDULER_MAX_QUEUE,
+        rate=SCHEDULER_RATE_PER_MINUTE / 60,
+        burst=SCHEDULER_BURST,
+        max_per_client=SCHEDULER_MAX_PER_CLIENT,
+    )
+    metrics.stats_collector.register(
+        "scheduler", controller.stats,
+        counters=('admitted', 'queued', 'rate_limited', 'overloaded', 'timed_out'),
+    )
+    return controller
 
-def save_to_database(prompt: str, width: int, height: int, steps: int, imgbb_response: dict) -> bool:
-    """Save image generation details to the database."""
+def _is_trusted_proxy(address: str) -> bool:
     try:
-        with get_db_connection() as connection:
-            with connection.cursor() as cursor:
-                data = imgbb_response['data']
-                insert_query = '''
-                INSERT INTO generated_images (
-                    generation_prompt, generation_timestamp, generation_width, generation_height, 
-                    generation_steps, imgbb_id, imgbb_title, imgbb_url_viewer, imgbb_url, 
-                    imgbb_display_url, imgbb_width, imgbb_height, imgbb_size, imgbb_time, 
-                    imgbb_expiration, delete_url, raw_response, user_id
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
-                '''
-                values = (
-                    prompt, datetime.now(), width, height, steps,
-                    data.get('id'), data.get('title'), data.get('url_viewer'),
-                    data.get('url'), data.get('display_url'), data.get('width'),
-                    data.get('height'), data.get('size'), data.get('time'),
-                    data.get('expiration'), data.get('delete_url'),
-                    json.dumps(imgbb_response), None  # Assuming user_id is optional
-                )
-                cursor.execute(insert_query, values)
-                connection.commit()
-                logger.info("Successfully saved to database")
-                return True
-    except Error as e:
-        logger.error(f"Database error: {e}")
+        ip = ipaddress.ip_address(address)
+    except ValueError:
         return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def get_client_id(request: Optional[gr.Request]) -> str:
+    """Identify the caller for rate limiting by peer address.
+
+    X-Forwarded-For is only honoured when the peer is in TRUSTED_PROXIES; the
+    client is then the right-most hop that is not itself a trusted proxy, since
+    anything to its left was supplied by the caller.
+    """
+    if request is None or request.client is None:
+        return "anonymous"
+    client = request.client.host
+    if not _is_trusted_proxy(client):
+        return client
+    forwarded = request.headers.get("x-forwarded-for", "")
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        client = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return client
+
+async def scheduled_generation(prompt: str, width: int, height: int, steps: int, fresh: bool = False,
+                               count: int = 1, style: str = genarationData.DEFAULT_STYLE,
+                               request: Optional[gr.Request] = None):
+    """Admit the request through the scheduler, reporting queue position until it runs."""
+    controller = get_admission_controller()
+    try:
+        ticket = controller.enter(get_client_id(request))
+    except AdmissionRejected as e:
+        yield None, str(e)
+        return
+    timed_out = False
+    try:
+        while not ticket.granted:
+            if time.monotonic() - ticket.enqueued_at > SCHEDULER_MAX_WAIT:
+                timed_out = True
+                yield None, "The queue is moving slowly right now, please try again shortly."
+                return
+            yield None, f"Waiting in queue: position {controller.position(ticket)} of {controller.queue_length()}..."
+            await ticket.wait(QUEUE_STATUS_INTERVAL)
+        # Free the slot as soon as generation is over; following the upload needs no provider capacity.
+        release = functools.partial(controller.release, ticket)
+        async for update in handle_generation_async(prompt, width, height, steps, fresh, count, style,
+                                                   on_generated=release):
+            yield update
+    finally:
+        controller.release(ticket, timed_out=timed_out)
+
+INSERT_IMAGE_SQL = '''
+INSERT INTO generated_images (
+    generation_prompt, generation_timestamp, generation_width, generation_height,
+    generation_steps, imgbb_id, imgbb_title, imgbb_url_viewer, imgbb_url,
+    imgbb_display_url, imgbb_width, imgbb_height, imgbb_size, imgbb_time,
+    imgbb_expiration, delete_url, thumbnail_url, preview_url, user_id
+) VALUES %s
+ON CONFLICT DO NOTHING
+RETURNING id, imgbb_id
+'''
+
+# Position of imgbb_id in the rows built by save_batch_to_database
+INSERT_IMAGE_SQL_KEY_INDEX = 5
+
+INSERT_RESPONSE_SQL = 'INSERT INTO generated_image_responses (image_id, raw_response) VALUES %s'
+
+@lru_cache(maxsize=1)
+def get_batch_writer() -> "BatchWriter":
+    """Create the shared batching writer for generated_images on first use."""
+    from batch_writer import BatchWriter
+    writer = BatchWriter(
+        get_db_pool(),
+        INSERT_IMAGE_SQL,
+        max_batch_size=DB_BATCH_SIZE,
+        max_delay=DB_BATCH_MAX_DELAY,
+        side_insert_sql=INSERT_RESPONSE_SQL,
+        key_index=INSERT_IMAGE_SQL_KEY_INDEX,
+    )
+    metrics.stats_collector.register(
+        "batch_writer", writer.stats,
+        counters=('batches', 'rows', 'failed_batches', 'failed_rows', 'flush_time_total'),
+    )
+    return writer
+
+@lru_cache(maxsize=1)
+def get_gallery_reader() -> "GalleryReader":
+    """Create the cached, keyset-paginated gallery reader on first use."""
+    from gallery import GalleryReader
+    reader = GalleryReader(
+        get_db_pool(),
+        cache_ttl=GALLERY_CACHE_TTL,
+        cache_size=GALLERY_CACHE_SIZE,
+        max_page_size=GALLERY_MAX_PAGE_SIZE,
+    )
+    metrics.stats_collector.register(
+        "gallery", reader.stats,
+        counters=('queries', 'cache_hits', 'cache_misses', 'query_time_total'),
+    )
+    return reader
+
+def _as_int(value) -> Optional[int]:
+    """ImgBB reports dimensions and sizes as strings; store them as integers."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def save_batch_to_database(prompt: str, width: int, height: int, steps: int, imgbb_responses: List[dict],
+                           derivative_urls: Optional[List[dict]] = None) -> List[bool]:
+    """Save a batch of images generated from one request, queued together in the batching writer.
+
+    Returns whether each row is committed. Inserting an image that is already
+    saved is a no-op, so retrying the rows that came back False is safe.
+    """
+    from psycopg2 import Error
+    timestamp = datetime.now()
+    rows = []
+    for i, imgbb_response in enumerate(imgbb_responses):
+        data = imgbb_response['data']
+        derivatives = (derivative_urls[i] if derivative_urls else None) or {}
+        row = (
+            prompt, timestamp, width, height, steps,
+            data.get('id'), data.get('title'), data.get('url_viewer'),
+            data.get('url'), data.get('display_url'), _as_int(data.get('width')),
+            _as_int(data.get('height')), _as_int(data.get('size')), data.get('time'),
+            data.get('expiration'), data.get('delete_url'),
+            derivatives.get('thumbnail'), derivatives.get('preview'),
+            None  # Assuming user_id is optional
+        )
+        # The full response goes to the side table; the columns above already hold what queries need.
+        side = (encode_response(imgbb_response),) if STORE_RAW_RESPONSES else None
+        rows.append((row, side))
+    deadline = time.monotonic() + DB_BATCH_MAX_DELAY + DB_POOL_TIMEOUT + 30
+    saved = []
+    for future in get_batch_writer().add_many(rows):
+        try:
+            future.result(timeout=max(0.0, deadline - time.monotonic()))
+            saved.append(True)
+        except (Error, FutureTimeoutError) as e:
+            logger.error(f"Database error: {e}")
+            saved.append(False)
+    logger.info(f"Successfully saved {saved.count(True)} of {len(rows)} row(s) to database")
+    return saved
+
+def apply_aspect_ratio(label: str):
+    """Move the width/height sliders to a preset; "Custom" leaves them where they are."""
+    size = genarationData.ASPECT_RATIOS.get(label)
+    if size is None:
+        return gr.update(), gr.update()
+    return gr.update(value=size[0]), gr.update(value=size[1])
 
 def create_demo():
     """Create and return the Gradio demo interface."""
@@ -257,20 +810,34 @@ def create_demo():
                     elem_id="prompt-input",
                     elem_classes="accessible-input",
                 )
+
+                style_input = gr.Dropdown(
+                    choices=genarationData.STYLE_NAMES,
+                    value=genarationData.DEFAULT_STYLE,
+                    label="Style",
+                    elem_id="style-input",
+                )
+
+                aspect_input = gr.Dropdown(
+                    choices=list(genarationData.ASPECT_RATIOS),
+                    value="832 x 1216",
+                    label="Aspect Ratio",
+                    elem_id="aspect-input",
+                )
                 
                 with gr.Row():
                     width_input = gr.Slider(
-                        minimum=256,
-                        maximum=1440,
+                        minimum=genarationData.MIN_DIMENSION,
+                        maximum=genarationData.MAX_DIMENSION,
                         value=832,
-                        step=16,
+                        step=genarationData.DIMENSION_STEP,
                         label="Image Width",
                     )
                     height_input = gr.Slider(
-                        minimum=256,
-                        maximum=1440,
+                        minimum=genarationData.MIN_DIMENSION,
+                        maximum=genarationData.MAX_DIMENSION,
                         value=1216,
-                        step=16,
+                        step=genarationData.DIMENSION_STEP,
                         label="Image Height",
                     )
                 
@@ -281,6 +848,20 @@ def create_demo():
                     step=1,
                     label="Generation Steps",
                 )
+
+                fresh_input = gr.Checkbox(
+                    value=False,
+                    label="Fresh sample (skip cached results for this prompt)",
+                    elem_id="fresh-input",
+                )
+
+                count_input = gr.Slider(
+                    minimum=1,
+                    maximum=MAX_BATCH_SIZE,
+                    value=1,
+                    step=1,
+                    label="Number of Images",
+                )
                 
                 generate_btn = gr.Button(
                     "Generate Image",
@@ -290,8 +871,10 @@ def create_demo():
                 )
 
             with gr.Column():
-                image_output = gr.Image(
-                    label="Generated Image",
+                image_output = gr.Gallery(
+                    label="Generated Images",
+                    columns=2,
+                    object_fit="contain",
                     elem_id="generated-image",
                     elem_classes="accessible-image",
                     show_label=True
@@ -303,11 +886,20 @@ def create_demo():
                     elem_classes="accessible-status"
                 )
 
+        aspect_input.change(
+            fn=apply_aspect_ratio,
+            inputs=aspect_input,
+            outputs=[width_input, height_input],
+            queue=False,
+        )
+
         # Event binding for image generation
         generate_btn.click(
-            fn=handle_generation,
-            inputs=[prompt_input, width_input, height_input, steps_input],
-            outputs=[image_output, status_output]
+            fn=scheduled_generation,
+            inputs=[prompt_input, width_input, height_input, steps_input, fresh_input, count_input, style_input],
+            outputs=[image_output, status_output],
+            # Admission is handled by scheduled_generation; let Gradio hand over everything it may hold.
+            concurrency_limit=SCHEDULER_MAX_CONCURRENCY + SCHEDULER_MAX_QUEUE,
         )
 
         gr.HTML("""
@@ -335,10 +927,65 @@ def create_demo():
         """)
     return demo
 
-if __name__ == "__main__":
-    init_db()  # Initialize the database on program start
+def readiness() -> Tuple[bool, dict]:
+    """Report whether this process can take generation traffic, with the individual checks."""
+    checks = {
+        'schema': schema_ready.is_set() or SCHEMA_INIT == "skip",
+    }
+    return all(checks.values()), checks
+
+def create_app() -> FastAPI:
+    """Mount the Gradio demo on a FastAPI app that also serves the gallery API, metrics and health checks."""
     demo = create_demo()
-    demo.launch(
-        server_name="0.0.0.0",
-        server_port=7860,
-        share=True)
+    demo.queue(max_size=SCHEDULER_MAX_CONCURRENCY + SCHEDULER_MAX_QUEUE)
+    server = FastAPI(title="Elixir Craft Image Generator")
+
+    @server.get("/metrics", include_in_schema=False)
+    def prometheus_metrics() -> Response:
+        payload, content_type = metrics.render()
+        return Response(content=payload, media_type=content_type)
+
+    if STORAGE_BACKEND == "local":
+        from fastapi.staticfiles import StaticFiles
+        os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+        server.mount(LOCAL_STORAGE_PATH, StaticFiles(directory=LOCAL_STORAGE_DIR), name="media")
+
+    @server.get("/api/gallery")
+    def gallery_page(limit: int = 24, cursor: Optional[str] = None, q: Optional[str] = None,
+                     width: Optional[int] = None, height: Optional[int] = None,
+                     steps: Optional[int] = None) -> dict:
+        """Newest images first; pass the returned ``next_cursor`` to get the following page."""
+        try:
+            return get_gallery_reader().page(limit, cursor, q, width, height, steps)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @server.get("/healthz", include_in_schema=False)
+    def liveness() -> dict:
+        return {'status': "alive", 'uptime': round(time.monotonic() - STARTED_AT, 3)}
+
+    @server.get("/readyz", include_in_schema=False)
+    def ready() -> JSONResponse:
+        is_ready, checks = readiness()
+        return JSONResponse({'status': "ready" if is_ready else "starting", 'checks': checks},
+                            status_code=200 if is_ready else 503)
+
+    return gr.mount_gradio_app(server, demo, path="/")
+
+def shutdown():
+    """Drain and close whatever was started, without creating anything that never was."""
+    for getter, close in ((get_persistence_queue, 'stop'), (get_upload_threads, 'shutdown'),
+                          (get_derivative_threads, 'shutdown'),
+                          (get_derivative_pool, 'shutdown'),
+                          (get_batch_writer, 'close'), (get_db_pool, 'closeall')):
+        if getter.cache_info().currsize:
+            getattr(getter(), close)()
+
+if __name__ == "__main__":
+    if SCHEMA_INIT == "blocking":
+        init_db()
+    elif SCHEMA_INIT == "background":
+        init_db_in_background()
+    atexit.register(shutdown)
+    get_persistence_queue()  # Start the writers and replay jobs spooled before a restart
+    uvicorn.run(create_app(), host="0.0.0.0", port=7860)
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from metrics import observe
+
+if TYPE_CHECKING:
+    from db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Collect rows from many threads and insert them with one multi-row statement.
+
+    A batch is flushed once ``max_batch_size`` rows are waiting or the oldest
+    row has waited ``max_delay`` seconds, whichever comes first. ``add``
+    returns a Future that resolves once the row's batch is committed, so
+    callers can still confirm their write.
+
+    With ``side_insert_sql`` every row is a ``(row, side_values)`` pair:
+    ``insert_sql`` must end in ``RETURNING id, <key>``, where ``<key>`` is the
+    column filled from ``row[key_index]``, and each ``side_values`` that is
+    not None is inserted with the returned id prepended, in the same
+    transaction. Rows the insert skips (``ON CONFLICT DO NOTHING``) return
+    nothing, so their side values are skipped too.
+
+    If a batch fails because of a row's data (see ``_is_row_error``) it is
+    split in half and each half retried, down to single rows, so one bad row
+    fails only its own Future. Any other error, such as a lost connection,
+    fails the whole batch at once.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', insert_sql: str,
+                 max_batch_size: int = 100, max_delay: float = 0.5,
+                 side_insert_sql: Optional[str] = None, key_index: int = 0):
+        self._pool = pool
+        self._insert_sql = insert_sql
+        self._side_insert_sql = side_insert_sql
+        self._key_index = key_index
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[tuple, Future]] = []
+        self._oldest: Optional[float] = None
+        self._closed = False
+        self._stats = {
+            'batches': 0,
+            'rows': 0,
+            'failed_batches': 0,
+            'failed_rows': 0,
+            'batch_size_max': 0,
+            'flush_time_total': 0.0,
+            'flush_time_max': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, row: tuple) -> Future:
+        """Queue a row for the next batch."""
+        return self.add_many([row])[0]
+
+    def add_many(self, rows: List[tuple]) -> List[Future]:
+        """Queue several rows together so they land in the same batch where possible."""
+        futures = [Future() for _ in rows]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchWriter is closed")
+            first = not self._pending
+            if first:
+                self._oldest = time.monotonic()
+            self._pending.extend(zip(rows, futures))
+            # Wake the writer to start the delay timer, or to flush a full batch now.
+            if first or len(self._pending) >= self._max_batch_size:
+                self._cond.notify()
+        return futures
+
+    def _take_batch(self) -> Optional[List[Tuple[tuple, Future]]]:
+        with self._cond:
+            while True:
+                if self._pending:
+                    if len(self._pending) >= self._max_batch_size or self._closed:
+                        break
+                    remaining = self._oldest + self._max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = self._pending[:self._max_batch_size]
+            self._pending = self._pending[self._max_batch_size:]
+            self._oldest = time.monotonic() if self._pending else None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _write_rows(self, rows: List[tuple]):
+        """Insert and commit one batch; override to target another database."""
+        from psycopg2.extras import execute_values
+        with self._pool.connection() as connection:
+            with connection.cursor() as cursor:
+                if self._side_insert_sql is None:
+                    execute_values(cursor, self._insert_sql, rows, page_size=len(rows))
+                else:
+                    returned = execute_values(cursor, self._insert_sql, [row for row, _ in rows],
+                                              page_size=len(rows), fetch=True)
+                    ids = {key: row_id for row_id, key in returned}
+                    # pop: of two rows with the same key only the one inserted gets side values.
+                    side_rows = [(ids.pop(row[self._key_index]), *side) for row, side in rows
+                                 if side is not None and row[self._key_index] in ids]
+                    if side_rows:
+                        execute_values(cursor, self._side_insert_sql, side_rows, page_size=len(side_rows))
+            connection.commit()
+
+    def _is_row_error(self, exc: Exception) -> bool:
+        """Whether ``exc`` blames the data of some row, so retrying smaller batches can isolate it."""
+        from psycopg2 import DataError, IntegrityError
+        return isinstance(exc, (DataError, IntegrityError))
+
+    def _write_or_split(self, batch: List[Tuple[tuple, Future]]) -> int:
+        """Write ``batch``, bisecting on row errors; resolve every Future and return the rows written."""
+        try:
+            with observe('db_insert'):
+                self._write_rows([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1 or not self._is_row_error(e):
+                if len(batch) == 1:
+                    logger.error(f"Insert of row {batch[0][0]!r:.200} failed: {e}")
+                else:
+                    logger.error(f"Insert of {len(batch)} row(s) failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                return 0
+            logger.warning(f"Insert of {len(batch)} row(s) failed, retrying in halves: {e}")
+            middle = len(batch) // 2
+            return self._write_or_split(batch[:middle]) + self._write_or_split(batch[middle:])
+        for _, future in batch:
+            future.set_result(True)
+        return len(batch)
+
+    def _flush(self, batch: List[Tuple[tuple, Future]]):
+        start = time.monotonic()
+        written = self._write_or_split(batch)
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._stats['batches'] += 1
+            self._stats['rows'] += written
+            self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(batch))
+            self._stats['flush_time_total'] += elapsed
+            self._stats['flush_time_max'] = max(self._stats['flush_time_max'], elapsed)
+            if written < len(batch):
+                self._stats['failed_batches'] += 1
+                self._stats['failed_rows'] += len(batch) - written
+        logger.info(f"Inserted batch of {written}/{len(batch)} row(s) in {elapsed * 1000:.1f} ms")
+
+    def stats(self) -> dict:
+        """Return batch-size and flush-latency statistics."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = len(self._pending)
+        batches = snapshot['batches']
+        snapshot['batch_size_avg'] = snapshot['rows'] / batches if batches else 0.0
+        snapshot['flush_time_avg'] = snapshot['flush_time_total'] / batches if batches else 0.0
+        return snapshot
+
+    def close(self, timeout: float = 30.0):
+        """Flush everything still pending and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
@@ -0,0 +1,113 @@
+"""Compare peak memory and CPU per image for the legacy and zero-copy image paths.
+
+Each path runs in its own subprocess so ``ru_maxrss`` reflects only that path:
+
+    python benchmarks/bench_image_path.py --size 1440 --iterations 20
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ('legacy', 'zero-copy')
+
+
+def make_payload(size: int) -> str:
+    """Build a provider-style base64 PNG that does not compress away."""
+    from PIL import Image
+    image = Image.effect_noise((size, size), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def legacy_path(b64: str):
+    """decode -> PIL -> re-encode to base64 -> url-encoded form body."""
+    from PIL import Image
+    from requests.models import RequestEncodingMixin
+    image_bytes = base64.b64decode(b64)
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    img_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    return RequestEncodingMixin._encode_params({"key": "bench", "image": img_base64})
+
+
+def zero_copy_path(b64: str):
+    """Lazy decode for display, provider base64 passed through in a multipart body."""
+    from requests.models import RequestEncodingMixin
+    from image_payload import GeneratedImage
+    generated = GeneratedImage.from_b64(b64)
+    generated.image.load()
+    return RequestEncodingMixin._encode_files({"image": generated.upload_part()}, {"key": "bench"})
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_mode(mode: str, size: int, iterations: int) -> dict:
+    b64 = make_payload(size)
+    path = legacy_path if mode == 'legacy' else zero_copy_path
+    path(b64)  # Warm imports and allocator pools outside the measurement.
+    rss_before = max_rss_mb()
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        path(b64)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'mode': mode,
+        'payload_mb': len(b64) / (1024 * 1024),
+        'cpu_ms_per_image': cpu * 1000 / iterations,
+        'wall_ms_per_image': wall * 1000 / iterations,
+        'peak_rss_mb': max_rss_mb(),
+        'peak_rss_growth_mb': max_rss_mb() - rss_before,
+        'peak_traced_mb': traced_peak / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1440, help="square image edge in pixels")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.size, args.iterations)))
+        return
+
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--size', str(args.size),
+             '--iterations', str(args.iterations)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.size}x{args.size} PNG, base64 payload {results[0]['payload_mb']:.2f} MB, "
+          f"{args.iterations} iterations")
+    print(f"{'path':<10} {'cpu ms/img':>11} {'wall ms/img':>12} {'peak RSS MB':>12} "
+          f"{'RSS growth MB':>14} {'traced peak MB':>15}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['cpu_ms_per_image']:>11.1f} {r['wall_ms_per_image']:>12.1f} "
+              f"{r['peak_rss_mb']:>12.1f} {r['peak_rss_growth_mb']:>14.1f} {r['peak_traced_mb']:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Compare generated_images size and scan speed with raw_response inline vs in a side table.
+
+Loads the same synthetic rows into four layouts inside a throwaway schema on
+a real PostgreSQL server, then reports relation sizes, the average stored
+size of one raw response (``pg_column_size``) next to its JSON length, and
+sequential-scan times for each:
+
+- inline:  raw_response TEXT on the hot table (the layout before migration 6)
+- jsonb:   raw_response JSONB in a side table, lz4 where supported
+- side:    raw_response BYTEA in a side table, zlib-compressed by the app (what the app writes)
+- dropped: no raw response at all (STORE_RAW_RESPONSES=False)
+
+Responses this small stay below the ~2 KB TOAST threshold, so only the app
+side compression in ``side`` actually shrinks them.
+
+    python benchmarks/bench_raw_response.py --dsn postgresql://localhost/scratch --rows 200000
+
+The schema is dropped afterwards; nothing outside it is touched.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from raw_response import encode_response
+
+COLUMNS = '''
+    id SERIAL PRIMARY KEY,
+    generation_prompt TEXT NOT NULL,
+    generation_timestamp TIMESTAMP NOT NULL,
+    generation_width INT NOT NULL,
+    generation_height INT NOT NULL,
+    generation_steps INT NOT NULL,
+    imgbb_id VARCHAR(255) NOT NULL,
+    imgbb_title VARCHAR(255),
+    imgbb_url_viewer TEXT,
+    imgbb_url TEXT,
+    imgbb_display_url TEXT,
+    imgbb_width INT,
+    imgbb_height INT,
+    imgbb_size BIGINT,
+    imgbb_time VARCHAR(50),
+    imgbb_expiration VARCHAR(50),
+    delete_url TEXT,
+    user_id VARCHAR(255)
+'''
+INSERT_COLUMNS = (
+    'generation_prompt, generation_timestamp, generation_width, generation_height, generation_steps, '
+    'imgbb_id, imgbb_title, imgbb_url_viewer, imgbb_url, imgbb_display_url, imgbb_width, imgbb_height, '
+    'imgbb_size, imgbb_time, imgbb_expiration, delete_url, user_id'
+)
+LAYOUTS = ('inline', 'jsonb', 'side', 'dropped')
+SIDE_TYPES = {'jsonb': 'JSONB', 'side': 'BYTEA'}
+WORDS = ("astronaut cat castle neon forest portrait dragon ocean city sunset robot garden "
+         "watercolor cinematic misty mountain cyberpunk anime baroque library").split()
+
+
+def imgbb_response(rng: random.Random, width: int, height: int) -> dict:
+    """A response shaped like ImgBB's, including the image/thumb/medium variants it returns."""
+    image_id = uuid.UUID(int=rng.getrandbits(128)).hex[:7]
+    size = rng.randint(200_000, 2_000_000)
+
+    def variant(suffix: str, name: str) -> dict:
+        return {'filename': f"{name}.png", 'name': name, 'mime': 'image/png', 'extension': 'png',
+                'url': f"https://i.ibb.co/{image_id}/{name}{suffix}.png"}
+
+    data = {
+        'id': image_id, 'title': image_id, 'url_viewer': f"https://ibb.co/{image_id}",
+        'url': f"https://i.ibb.co/{image_id}/image.png", 'display_url': f"https://i.ibb.co/{image_id}/image.png",
+        'width': str(width), 'height': str(height), 'size': str(size),
+        'time': str(1_700_000_000 + rng.randint(0, 10_000_000)), 'expiration': '0',
+        'image': variant('', 'image'), 'thumb': variant('-thumb', 'image'), 'medium': variant('-medium', 'image'),
+        'delete_url': f"https://ibb.co/{image_id}/{uuid.UUID(int=rng.getrandbits(128)).hex}",
+    }
+    return {'data': data, 'success': True, 'status': 200}
+
+
+def make_rows(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        width, height = rng.choice(((832, 1216), (1216, 832), (1024, 1024), (1344, 768)))
+        response = imgbb_response(rng, width, height)
+        data = response['data']
+        prompt = " ".join(rng.choices(WORDS, k=rng.randint(6, 30)))
+        row = (prompt, start + timedelta(seconds=i * 7), width, height, rng.randint(1, 4),
+               data['id'], data['title'], data['url_viewer'], data['url'], data['display_url'],
+               width, height, int(data['size']), data['time'], data['expiration'], data['delete_url'], None)
+        yield row, json.dumps(response, separators=(',', ':'))
+
+
+def create_layout(cursor, layout: str, lz4: bool):
+    extra = ',\n    raw_response TEXT' if layout == 'inline' else ''
+    cursor.execute(f"CREATE TABLE {layout}_images ({COLUMNS}{extra})")
+    if layout in SIDE_TYPES:
+        cursor.execute(f'''
+            CREATE TABLE {layout}_responses (
+                image_id INT PRIMARY KEY REFERENCES {layout}_images (id) ON DELETE CASCADE,
+                raw_response {SIDE_TYPES[layout]} NOT NULL
+            )''')
+        if layout == 'jsonb' and lz4:
+            cursor.execute("ALTER TABLE jsonb_responses ALTER COLUMN raw_response SET COMPRESSION lz4")
+
+
+def load(cursor, layout: str, rows: list, batch: int) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(rows), batch):
+        chunk = rows[offset:offset + batch]
+        if layout == 'inline':
+            execute_values(cursor, f"INSERT INTO inline_images ({INSERT_COLUMNS}, raw_response) VALUES %s",
+                           [row + (raw,) for row, raw in chunk], page_size=len(chunk))
+        elif layout in SIDE_TYPES:
+            ids = execute_values(cursor, f"INSERT INTO {layout}_images ({INSERT_COLUMNS}) VALUES %s RETURNING id",
+                                 [row for row, _ in chunk], page_size=len(chunk), fetch=True)
+            if layout == 'side':
+                chunk = [(row, encode_response(json.loads(raw))) for row, raw in chunk]
+            execute_values(cursor, f"INSERT INTO {layout}_responses (image_id, raw_response) VALUES %s",
+                           [(row_id, raw) for (row_id,), (_, raw) in zip(ids, chunk)], page_size=len(chunk))
+        else:
+            execute_values(cursor, f"INSERT INTO dropped_images ({INSERT_COLUMNS}) VALUES %s",
+                           [row for row, _ in chunk], page_size=len(chunk))
+    return time.perf_counter() - start
+
+
+def relation_size(cursor, name: str, total: bool = False) -> int:
+    cursor.execute(f"SELECT {'pg_total_relation_size' if total else 'pg_relation_size'}(%s)", (name,))
+    return cursor.fetchone()[0]
+
+
+def time_query(cursor, sql: str, repeat: int) -> list:
+    cursor.execute(sql)  # warm the buffer cache so runs compare layouts, not disk
+    cursor.fetchall()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def mb(size: int) -> str:
+    return f"{size / (1024 * 1024):8.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dsn', default=os.getenv('POSTGRES_URL'), help="defaults to $POSTGRES_URL")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per query")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("pass --dsn or set POSTGRES_URL")
+
+    connection = psycopg2.connect(args.dsn)
+    connection.autocommit = True
+    schema = f"bench_raw_response_{os.getpid()}"
+    cursor = connection.cursor()
+    cursor.execute("SELECT current_setting('server_version_num')::INT")
+    lz4 = cursor.fetchone()[0] >= 140000
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    try:
+        cursor.execute(f"SET search_path TO {schema}")
+        if lz4:
+            try:
+                cursor.execute("CREATE TEMP TABLE lz4_probe (value TEXT COMPRESSION lz4)")
+            except psycopg2.Error:
+                lz4 = False
+        rows = list(make_rows(args.rows))
+        print(f"{args.rows} rows, raw responses average "
+              f"{statistics.mean(len(raw) for _, raw in rows):.0f} bytes, jsonb side table compression "
+              f"{'lz4' if lz4 else 'pglz'}")
+
+        print(f"\n{'layout':<8} {'load':>8} {'hot heap':>11} {'hot total':>11} {'side total':>11} "
+              f"{'raw':>6} {'stored':>7} {'seq scan':>10} {'page':>9}")
+        for layout in LAYOUTS:
+            create_layout(cursor, layout, lz4)
+            load_time = load(cursor, layout, rows, args.batch)
+            cursor.execute(f"VACUUM ANALYZE {layout}_images")
+            side_total = 0
+            raw_table = {'inline': 'inline_images'}.get(layout, f"{layout}_responses")
+            if layout in SIDE_TYPES:
+                cursor.execute(f"VACUUM ANALYZE {raw_table}")
+                side_total = relation_size(cursor, raw_table, total=True)
+            # Bytes one response occupies on disk after any compression, against its JSON length.
+            raw_avg = stored_avg = 0.0
+            if layout != 'dropped':
+                cursor.execute(f"SELECT avg(pg_column_size(raw_response)) FROM {raw_table}")
+                stored_avg = float(cursor.fetchone()[0])
+                raw_avg = statistics.mean(len(raw) for _, raw in rows)
+            # A filter with no index forces a full read of the hot table, like gallery scans without a cursor.
+            scan = time_query(cursor, f"SELECT count(*) FROM {layout}_images WHERE generation_steps = 3", args.repeat)
+            page = time_query(cursor, f"SELECT * FROM {layout}_images ORDER BY id DESC LIMIT 24", args.repeat)
+            print(f"{layout:<8} {load_time:>7.2f}s {mb(relation_size(cursor, f'{layout}_images'))} "
+                  f"{mb(relation_size(cursor, f'{layout}_images', total=True))} {mb(side_total)} "
+                  f"{raw_avg:>6.0f} {stored_avg:>7.0f} {statistics.median(scan) * 1000:>7.1f} ms {statistics.median(page) * 1000:>6.2f} ms")
+    finally:
+        cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
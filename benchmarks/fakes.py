@@ -0,0 +1,205 @@
+"""Local stand-ins for Together, ImgBB and PostgreSQL used by the load test.
+
+The HTTP fakes speak just enough of each API for app.py's clients, with
+configurable latency, error rate and payload size. ``SQLiteBatchWriter``
+replaces the PostgreSQL batch insert with an equivalent SQLite one.
+"""
+import base64
+import json
+import os
+import random
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_writer import BatchWriter  # noqa: E402
+
+
+def make_png(size: int) -> bytes:
+    """Encode a ``size`` x ``size`` noise PNG without needing Pillow."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rng = random.Random(size)
+    raw = b''.join(b'\x00' + rng.randbytes(size * 3) for _ in range(size))
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b''))
+
+
+class FakeService:
+    """A threaded HTTP server with injected latency and failures."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeService':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, path: str, body: bytes) -> dict:
+        raise NotImplementedError
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: dict, headers: dict = None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with service._lock:
+                    service.requests += 1
+                time.sleep(max(0.0, service.latency + random.uniform(-service.jitter, service.jitter)))
+                if random.random() < service.error_rate:
+                    with service._lock:
+                        service.errors += 1
+                    self._send(503, {'error': {'message': 'injected failure'}}, {'Retry-After': '0'})
+                    return
+                self._send(200, service.respond(self.path, body))
+
+        return Handler
+
+
+class FakeTogether(FakeService):
+    """Answers ``POST /v1/images/generations`` with ``n`` base64 PNGs."""
+
+    def __init__(self, image_size: int = 512, **kwargs):
+        super().__init__(**kwargs)
+        self._b64 = base64.b64encode(make_png(image_size)).decode('ascii')
+
+    @property
+    def url(self) -> str:
+        return super().url + "/v1"
+
+    def respond(self, path: str, body: bytes) -> dict:
+        request = json.loads(body or b'{}')
+        return {
+            'id': uuid.uuid4().hex,
+            'model': request.get('model'),
+            'object': 'list',
+            'data': [{'index': i, 'b64_json': self._b64} for i in range(int(request.get('n', 1)))],
+        }
+
+
+class FakeImgBB(FakeService):
+    """Answers ``POST /1/upload`` with an ImgBB-shaped response."""
+
+    @property
+    def url(self) -> str:
+        return super().url + "/1/upload"
+
+    def respond(self, path: str, body: bytes) -> dict:
+        image_id = uuid.uuid4().hex[:7]
+        url = f"https://i.ibb.example/{image_id}/image.png"
+        return {
+            'data': {
+                'id': image_id,
+                'title': 'image',
+                'url_viewer': f"https://ibb.example/{image_id}",
+                'url': url,
+                'display_url': url,
+                'width': '512',
+                'height': '512',
+                'size': str(len(body)),
+                'time': str(int(time.time())),
+                'expiration': '0',
+                'delete_url': f"https://ibb.example/{image_id}/delete",
+                'thumb': {'url': f"https://i.ibb.example/{image_id}/image-thumb.png"},
+                'medium': {'url': f"https://i.ibb.example/{image_id}/image-medium.png"},
+            },
+            'success': True,
+            'status': 200,
+        }
+
+
+class SQLiteBatchWriter(BatchWriter):
+    """BatchWriter that inserts into local SQLite copies of ``generated_images`` and its response table."""
+
+    COLUMNS = (
+        'generation_prompt', 'generation_timestamp', 'generation_width', 'generation_height',
+        'generation_steps', 'imgbb_id', 'imgbb_title', 'imgbb_url_viewer', 'imgbb_url',
+        'imgbb_display_url', 'imgbb_width', 'imgbb_height', 'imgbb_size', 'imgbb_time',
+        'imgbb_expiration', 'delete_url', 'thumbnail_url', 'preview_url', 'user_id',
+    )
+
+    def __init__(self, path: str, **kwargs):
+        self._path = path
+        self._db_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{name} TEXT" for name in self.COLUMNS)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS generated_images (id INTEGER PRIMARY KEY, {columns}, UNIQUE (imgbb_id))")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS generated_image_responses (image_id INTEGER PRIMARY KEY, raw_response BLOB)")
+        self._connection.commit()
+        # OR IGNORE mirrors ON CONFLICT DO NOTHING in app.INSERT_IMAGE_SQL.
+        self._sql = (f"INSERT OR IGNORE INTO generated_images ({', '.join(self.COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(self.COLUMNS))})")
+        self._side_sql = "INSERT INTO generated_image_responses (image_id, raw_response) VALUES (?, ?)"
+        super().__init__(pool=None, insert_sql=self._sql, side_insert_sql=self._side_sql, **kwargs)
+
+    def _write_rows(self, rows: List[tuple]):
+        with self._db_lock:
+            for row, side in rows:
+                cursor = self._connection.execute(self._sql, tuple(map(_sqlite_value, row)))
+                if side is not None and cursor.rowcount:
+                    self._connection.execute(self._side_sql, (cursor.lastrowid, *side))
+            self._connection.commit()
+
+    def _is_row_error(self, exc: Exception) -> bool:
+        return isinstance(exc, (sqlite3.DataError, sqlite3.IntegrityError))
+
+    def update_derivatives(self, image_id: str, urls: dict):
+        """Stand-in for app.save_derivative_urls."""
+        with self._db_lock:
+            self._connection.execute(
+                "UPDATE generated_images SET thumbnail_url = ?, preview_url = ? WHERE imgbb_id = ?",
+                (urls.get('thumbnail'), urls.get('preview'), image_id))
+            self._connection.commit()
+
+    def count(self, where: str = '') -> int:
+        with self._db_lock:
+            return self._connection.execute(
+                f"SELECT COUNT(*) FROM generated_images {f'WHERE {where}' if where else ''}").fetchone()[0]
+
+
+def _sqlite_value(value):
+    return value if value is None or isinstance(value, (int, float, str, bytes)) else str(value)
@@ -0,0 +1,77 @@
+"""Profile how long ``import app`` takes, module by module.
+
+Imports the module in a fresh interpreter under ``-X importtime`` and prints
+the slowest imports by cumulative time, the total, and which heavy
+dependencies were pulled in eagerly. ``--max-ms`` and ``--forbid`` turn the
+report into a check that exits non-zero on a cold-start regression:
+
+    python benchmarks/import_profile.py --top 15 --max-ms 2000 --forbid together,psycopg2,requests
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies app.py defers until first use. Pillow, httpx and opentelemetry are not listed:
+# gradio imports them itself, so deferring them in app.py would save nothing.
+LAZY_MODULES = ('together', 'psycopg2', 'requests')
+
+
+def profile_import(module: str) -> list:
+    """Return ``(self_us, cumulative_us, depth, name)`` for every module the import loaded, target last."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    # Children are reported before their parent; drop interpreter startup imports that precede the tree.
+    end = next(i for i, row in enumerate(rows) if row[2] == 0 and row[3] == module)
+    start = max((i + 1 for i, row in enumerate(rows[:end]) if row[2] == 0), default=0)
+    return rows[start:end + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=20, help="how many of the slowest imports to list")
+    parser.add_argument('--repeat', type=int, default=3, help="profile this many times and keep the fastest")
+    parser.add_argument('--max-ms', type=float, help="fail if the import takes longer than this")
+    parser.add_argument('--forbid', default='', help="comma-separated top-level packages that must not be imported")
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(max(1, args.repeat))]
+    totals = [rows[-1][1] for rows in runs]
+    rows = runs[totals.index(min(totals))]
+    total_ms = min(totals) / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms across {len(rows)} modules (best of {len(runs)})")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for self_us, cumulative_us, depth, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>7.1f} ms  {'  ' * depth}{name}")
+
+    loaded = {name.split('.')[0] for _, _, _, name in rows}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    print(f"deferred dependencies imported eagerly: {', '.join(eager) or 'none'}")
+
+    failures = []
+    if args.max_ms is not None and total_ms > args.max_ms:
+        failures.append(f"import took {total_ms:.1f} ms, budget is {args.max_ms:.1f} ms")
+    forbidden = [name for name in filter(None, args.forbid.split(',')) if name.strip() in loaded]
+    if forbidden:
+        failures.append(f"forbidden modules imported: {', '.join(forbidden)}")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Offline load test: drive the generation handler against local fake upstreams.
+
+Starts fake Together and ImgBB servers, swaps PostgreSQL for SQLite, then fires
+``--requests`` generations at ``--concurrency`` through
+``handle_generation_async`` (or ``scheduled_generation`` with ``--scheduler``)
+and reports throughput, latency percentiles and memory. No network access or
+API keys are needed:
+
+    python benchmarks/load_test.py --concurrency 16 --requests 200 --together-latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+from fakes import FakeImgBB, FakeTogether, SQLiteBatchWriter
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def max_rss_mb() -> float:
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+# Final statuses that mean the images were generated and are in the gallery (or served from cache).
+SUCCESS_PREFIXES = ("Saved to the gallery!", "Image(s) served from cache")
+# The stream stopped following the job at STREAM_STATUS_TIMEOUT; whether it was saved is unknown.
+INCOMPLETE_PREFIX = "Still saving to the gallery"
+
+
+def outcome(final_status: str) -> str:
+    """Classify a request by its last status: 'ok', 'incomplete' or 'failed'."""
+    if final_status.startswith(SUCCESS_PREFIXES):
+        return 'ok'
+    if final_status.startswith(INCOMPLETE_PREFIX):
+        return 'incomplete'
+    return 'failed'
+
+
+def failure_reason(final_status: str) -> str:
+    """The first line of a failed status without job ids or numbers, so like failures group together."""
+    reason = final_status.split("\n")[0].split(" (job")[0]
+    return re.sub(r"\d+", "N", reason)[:100]
+
+
+def configure_environment(args, together: FakeTogether, imgbb: FakeImgBB, workdir: str):
+    """Point app.py at the fakes; must run before app is imported."""
+    os.environ.update({
+        'TOGETHER_API_KEY': 'offline-benchmark',
+        'TOGETHER_BASE_URL': together.url,
+        'IMGBB_API_KEY': 'offline-benchmark',
+        'IMGBB_UPLOAD_URL': imgbb.url,
+        'POSTGRES_URL': 'postgresql://offline@127.0.0.1/benchmark',
+        'PERSISTENCE_SPOOL_DIR': os.path.join(workdir, 'spool'),
+        'RESULT_CACHE_DIR': os.path.join(workdir, 'cache') if args.disk_cache else '',
+        'PROVIDER_MAX_N': str(args.provider_max_n),
+        'SCHEDULER_MAX_CONCURRENCY': str(args.concurrency),
+        'SCHEDULER_RATE_PER_MINUTE': '1000000',
+        'SCHEDULER_BURST': '1000000',
+        'SCHEDULER_MAX_PER_CLIENT': str(args.requests),
+        'RETRY_MAX_DELAY': '1',
+        'STORAGE_BACKEND': args.storage,
+        'LOCAL_STORAGE_DIR': os.path.join(workdir, 'media'),
+        'GENERATE_DERIVATIVES': str(args.derivatives),
+    })
+
+
+async def one_request(app, index: int, args, results: list):
+    # Distinct prompts defeat the result cache unless --repeat asks for hits.
+    prompt = f"benchmark prompt {index % args.repeat if args.repeat else index}"
+    handler = app.scheduled_generation if args.scheduler else app.handle_generation_async
+    start = time.perf_counter()
+    first_image = None
+    final_status = ""
+    async for images, status in handler(prompt, args.width, args.height, args.steps, False, args.batch_size):
+        if images and first_image is None:
+            first_image = time.perf_counter() - start
+        final_status = status
+    results.append({
+        'first_image': first_image,
+        'total': time.perf_counter() - start,
+        'outcome': outcome(final_status),
+        'status': final_status,
+    })
+
+
+async def drive(app, args) -> tuple:
+    results: list = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(index: int):
+        async with semaphore:
+            await one_request(app, index, args, results)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(args.requests)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=1, help="images per request")
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--height', type=int, default=512)
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--image-size', type=int, default=512, help="edge of the PNG the fake returns")
+    parser.add_argument('--together-latency', type=float, default=0.2)
+    parser.add_argument('--imgbb-latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of fake responses that 503")
+    parser.add_argument('--provider-max-n', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=0, help="cycle through this many prompts (cache hits)")
+    parser.add_argument('--disk-cache', action='store_true')
+    parser.add_argument('--scheduler', action='store_true', help="go through scheduled_generation")
+    parser.add_argument('--storage', choices=('imgbb', 'local'), default='imgbb')
+    parser.add_argument('--derivatives', action='store_true', help="render thumbnails/previews for --storage local")
+    parser.add_argument('--trace-memory', action='store_true', help="also report the tracemalloc peak")
+    args = parser.parse_args()
+
+    together = FakeTogether(image_size=args.image_size, latency=args.together_latency,
+                            jitter=args.jitter, error_rate=args.error_rate).start()
+    imgbb = FakeImgBB(latency=args.imgbb_latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    workdir = tempfile.mkdtemp(prefix='flux-bench-')
+    configure_environment(args, together, imgbb, workdir)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app
+
+    # Swap the PostgreSQL sink for SQLite; everything upstream of it is the real code path.
+    writer = SQLiteBatchWriter(os.path.join(workdir, 'generated_images.sqlite3'),
+                               max_batch_size=app.DB_BATCH_SIZE, max_delay=app.DB_BATCH_MAX_DELAY)
+    app.get_batch_writer = lambda: writer
+    app.save_derivative_urls = writer.update_derivatives
+
+    rss_before = max_rss_mb()
+    if args.trace_memory:
+        tracemalloc.start()
+    results, elapsed = asyncio.run(drive(app, args))
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+
+    app.get_persistence_queue().stop()
+    if app.get_upload_threads.cache_info().currsize:
+        app.get_upload_threads().shutdown()
+    if args.derivatives:
+        app.get_derivative_threads().shutdown()
+        app.get_derivative_pool().shutdown()
+    writer.close()
+    together.stop()
+    imgbb.stop()
+
+    outcomes = Counter(r['outcome'] for r in results)
+    ok = [r for r in results if r['outcome'] == 'ok']
+    # Only finished requests: an incomplete one stopped at the stream timeout, not when its save completed.
+    totals = [r['total'] for r in ok]
+    firsts = [r['first_image'] for r in results if r['first_image'] is not None]
+    print(f"requests={args.requests} concurrency={args.concurrency} batch={args.batch_size} "
+          f"ok={outcomes['ok']} incomplete={outcomes['incomplete']} failed={outcomes['failed']}")
+    failures = Counter(failure_reason(r['status']) for r in results if r['outcome'] == 'failed')
+    for reason, count in failures.most_common():
+        print(f"{count:>8} failed: {reason}")
+    print(f"throughput: {len(ok) / elapsed:.2f} req/s, {len(ok) * args.batch_size / elapsed:.2f} images/s "
+          f"over {elapsed:.2f}s")
+    for label, values in (("first image", firsts), ("complete", totals)):
+        print(f"{label:>12}: p50 {percentile(values, 50) * 1000:.0f} ms  "
+              f"p95 {percentile(values, 95) * 1000:.0f} ms  p99 {percentile(values, 99) * 1000:.0f} ms")
+    print(f"memory: peak RSS {max_rss_mb():.1f} MB (+{max_rss_mb() - rss_before:.1f} MB during run)"
+          + (f", traced peak {traced_peak / (1024 * 1024):.1f} MB" if traced_peak is not None else ""))
+    print(f"upstream calls: together={together.requests} ({together.errors} injected errors), "
+          f"imgbb={imgbb.requests} ({imgbb.errors} injected errors)")
+    print(f"rows written: {writer.count()} ({writer.count('thumbnail_url IS NOT NULL')} with thumbnails), "
+          f"batch writer: {writer.stats()}")
+    print(f"result cache: {app.get_result_cache().stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key."""
+    return " ".join(prompt.split()).casefold()
+
+
+class ResultCache:
+    """Two-tier (memory + disk) LRU cache of generated images, keyed by content hash.
+
+    Both tiers are bounded in bytes and entries expire ``ttl`` seconds after
+    they were stored. Disk hits are promoted to memory. Pass ``directory=None``
+    to run memory-only.
+    """
+
+    def __init__(self, directory: Optional[str], ttl: float,
+                 memory_bytes: int = 256 * 1024 * 1024, disk_bytes: int = 2 * 1024 * 1024 * 1024):
+        self._directory = directory
+        self._ttl = ttl
+        self._memory_limit = memory_bytes
+        self._disk_limit = disk_bytes
+        self._lock = threading.Lock()
+        self._memory: OrderedDict = OrderedDict()  # key -> (value, stored_at)
+        self._memory_size = 0
+        self._disk: OrderedDict = OrderedDict()  # key -> (size, stored_at)
+        self._disk_size = 0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def key(prompt: str, width: int, height: int, steps: int, variant: int = 0) -> str:
+        """Build the cache key for a set of generation parameters.
+
+        ``variant`` numbers the images of a batch; variant 0 is the single-image key.
+        """
+        material = f"{normalize_prompt(prompt)}\x00{int(width)}x{int(height)}\x00{int(steps)}"
+        if variant:
+            material += f"\x00{int(variant)}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.bin")
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith('.bin'):
+                continue
+            try:
+                st = os.stat(os.path.join(self._directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len('.bin')], st.st_size))
+        for stored_at, key, size in sorted(entries):
+            self._disk[key] = (size, stored_at)
+            self._disk_size += size
+        self._evict_disk()
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.time() - stored_at > self._ttl
+
+    def _remove_file(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_memory(self):
+        while self._memory_size > self._memory_limit and self._memory:
+            _, (value, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(value)
+            self._stats['evictions'] += 1
+
+    def _evict_disk(self):
+        while self._disk_size > self._disk_limit and self._disk:
+            key, (size, _) = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self._stats['evictions'] += 1
+            self._remove_file(key)
+
+    def _store_memory(self, key: str, value: bytes, stored_at: float):
+        if len(value) > self._memory_limit:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[0])
+        self._memory[key] = (value, stored_at)
+        self._memory_size += len(value)
+        self._evict_memory()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached image bytes, or None on a miss or expiry."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if not self._expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+                self._memory_size -= len(value)
+                self._stats['expired'] += 1
+            disk_entry = self._disk.get(key) if self._directory else None
+            if disk_entry is None:
+                self._stats['misses'] += 1
+                return None
+            size, stored_at = disk_entry
+            if self._expired(stored_at):
+                del self._disk[key]
+                self._disk_size -= size
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                self._remove_file(key)
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = f.read()
+        except OSError as e:
+            logger.warning(f"Result cache file for {key} is unreadable: {e}")
+            with self._lock:
+                if self._disk.pop(key, None) is not None:
+                    self._disk_size -= size
+                self._stats['misses'] += 1
+            return None
+        with self._lock:
+            self._stats['disk_hits'] += 1
+            self._store_memory(key, value, stored_at)
+        return value
+
+    def put(self, key: str, value: bytes):
+        """Store image bytes in both tiers."""
+        stored_at = time.time()
+        with self._lock:
+            self._store_memory(key, value, stored_at)
+        if not self._directory or len(value) > self._disk_limit:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write result cache entry {key}: {e}")
+            return
+        with self._lock:
+            old = self._disk.pop(key, None)
+            if old is not None:
+                self._disk_size -= old[0]
+            self._disk[key] = (len(value), stored_at)
+            self._disk_size += len(value)
+            self._evict_disk()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current tier sizes."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_size,
+                disk_entries=len(self._disk),
+                disk_bytes=self._disk_size,
+            )
+        return snapshot
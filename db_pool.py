@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Thread-safe, bounded PostgreSQL connection pool.
+
+    Connections are checked out LIFO so the warmest connection is reused first.
+    A connection that has been idle longer than ``health_check_interval`` is
+    pinged before it is handed out and transparently replaced if it is broken.
+    Callers block for at most ``timeout`` seconds when the pool is exhausted.
+    """
+
+    def __init__(self, config: dict, minconn: int = 1, maxconn: int = 10,
+                 timeout: float = 10.0, health_check_interval: float = 30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+        self._config = config
+        self._minconn = minconn
+        self._maxconn = maxconn
+        self._timeout = timeout
+        self._health_check_interval = health_check_interval
+        self._cond = threading.Condition()
+        self._idle: deque = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connects': 0,
+            'reconnects': 0,
+            'discarded': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+        self._prefill()
+
+    def _prefill(self):
+        """Open ``minconn`` connections up front; failures are retried lazily."""
+        for _ in range(self._minconn):
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                logger.warning(f"Could not pre-open pooled connection: {e}")
+                break
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self) -> extensions.connection:
+        conn = psycopg2.connect(**self._config)
+        with self._cond:
+            self._stats['connects'] += 1
+        logger.info('Opened pooled PostgreSQL connection')
+        return conn
+
+    def _is_healthy(self, conn: extensions.connection, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self._health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn: extensions.connection):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self) -> extensions.connection:
+        """Check out a healthy connection, waiting up to the pool timeout."""
+        start = time.monotonic()
+        deadline = start + self._timeout
+        conn: Optional[extensions.connection] = None
+        last_used = 0.0
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self._maxconn:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(f"Timed out after {self._timeout}s waiting for a database connection")
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn, last_used):
+                logger.warning("Discarding broken pooled connection, reconnecting")
+                self._close_quietly(conn)
+                with self._cond:
+                    self._stats['reconnects'] += 1
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+        return conn
+
+    def putconn(self, conn: extensions.connection, broken: bool = False):
+        """Return a connection to the pool, discarding it if it is unusable."""
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        with self._cond:
+            self._in_use -= 1
+            if broken or conn.closed or self._closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[extensions.connection]:
+        """Borrow a connection for the duration of a ``with`` block."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def stats(self) -> dict:
+        """Return a snapshot of pool usage and wait metrics."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                maxconn=self._maxconn,
+            )
+        checkouts = snapshot['checkouts']
+        snapshot['wait_time_avg'] = snapshot['wait_time_total'] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
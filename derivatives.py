@@ -0,0 +1,23 @@
+import io
+from typing import Dict, Tuple
+
+
+def make_derivatives(data: bytes, sizes: Dict[str, int], webp_quality: int) -> Dict[str, Tuple[bytes, str]]:
+    """Render a WebP copy of an encoded image fitted inside each ``{kind: max_edge}`` of ``sizes``.
+
+    Runs in a worker process, so it takes and returns plain bytes and imports
+    Pillow itself. Returns ``{kind: (data, extension)}``.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = source.convert('RGB') if source.mode not in ('RGB', 'RGBA') else source.copy()
+
+    renditions = {}
+    for kind, max_edge in sizes.items():
+        rendition = image.copy()
+        rendition.thumbnail((max_edge, max_edge))
+        out = io.BytesIO()
+        rendition.save(out, 'WEBP', quality=webp_quality, method=4)
+        renditions[kind] = (out.getvalue(), 'webp')
+    return renditions
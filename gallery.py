@@ -0,0 +1,134 @@
+import base64
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from metrics import observe
+
+if TYPE_CHECKING:
+    from db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+GALLERY_COLUMNS = (
+    'id', 'generation_prompt', 'generation_timestamp', 'generation_width', 'generation_height',
+    'generation_steps', 'imgbb_url', 'imgbb_display_url', 'imgbb_url_viewer',
+    'imgbb_width', 'imgbb_height', 'imgbb_size', 'thumbnail_url', 'preview_url',
+)
+
+# Must match the expression of idx_prompt_fts so the planner can use the GIN index.
+SEARCH_VECTOR = "to_tsvector('english', generation_prompt)"
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor."""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of ``encode_cursor``; raises ValueError on anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+class GalleryReader:
+    """Newest-first, keyset-paginated reads of ``generated_images``.
+
+    Pages are ordered by ``(generation_timestamp, id)`` and continue from a
+    cursor, so page 1000 costs the same index range scan as page 1. Optional
+    filters are a full-text prompt search and exact width/height/steps.
+    Identical queries within ``cache_ttl`` seconds are answered from a small
+    LRU cache without touching the database.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', cache_ttl: float = 10.0, cache_size: int = 256,
+                 max_page_size: int = 100):
+        self._pool = pool
+        self._cache_ttl = cache_ttl
+        self._cache_size = cache_size
+        self._max_page_size = max_page_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict = OrderedDict()  # query key -> (page, stored_at)
+        self._stats = {'queries': 0, 'cache_hits': 0, 'cache_misses': 0, 'query_time_total': 0.0}
+
+    @staticmethod
+    def _build_query(limit: int, after: Optional[Tuple[datetime, int]], search: Optional[str],
+                     width: Optional[int], height: Optional[int], steps: Optional[int]) -> Tuple[str, list]:
+        conditions: List[str] = []
+        params: list = []
+        if after is not None:
+            conditions.append('(generation_timestamp, id) < (%s, %s)')
+            params.extend(after)
+        if search:
+            conditions.append(f"{SEARCH_VECTOR} @@ websearch_to_tsquery('english', %s)")
+            params.append(search)
+        for column, value in (('generation_width', width), ('generation_height', height),
+                              ('generation_steps', steps)):
+            if value is not None:
+                conditions.append(f'{column} = %s')
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = (f"SELECT {', '.join(GALLERY_COLUMNS)} FROM generated_images {where} "
+               f"ORDER BY generation_timestamp DESC, id DESC LIMIT %s")
+        # One extra row tells us whether another page exists.
+        params.append(limit + 1)
+        return sql, params
+
+    def page(self, limit: int = 24, cursor: Optional[str] = None, search: Optional[str] = None,
+             width: Optional[int] = None, height: Optional[int] = None, steps: Optional[int] = None) -> dict:
+        """Return ``{'items': [...], 'next_cursor': str | None}`` for one page of the gallery."""
+        limit = max(1, min(int(limit), self._max_page_size))
+        search = " ".join(search.split()) if search else None
+        after = decode_cursor(cursor) if cursor else None
+        key = (limit, cursor, search, width, height, steps)
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self._cache_ttl:
+                self._cache.move_to_end(key)
+                self._stats['cache_hits'] += 1
+                return entry[0]
+            self._stats['cache_misses'] += 1
+
+        sql, params = self._build_query(limit, after, search, width, height, steps)
+        start = time.monotonic()
+        with observe('gallery_query'):
+            with self._pool.connection() as connection:
+                with connection.cursor() as db_cursor:
+                    db_cursor.execute(sql, params)
+                    rows = db_cursor.fetchall()
+                connection.rollback()
+        elapsed = time.monotonic() - start
+
+        items = [dict(zip(GALLERY_COLUMNS, row)) for row in rows[:limit]]
+        for item in items:
+            item['generation_timestamp'] = item['generation_timestamp'].isoformat()
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last[2], last[0])
+        page = {'items': items, 'next_cursor': next_cursor}
+
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['query_time_total'] += elapsed
+            self._cache[key] = (page, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return page
+
+    def stats(self) -> dict:
+        """Return query and response-cache statistics."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['cached_pages'] = len(self._cache)
+        return snapshot
@@ -117,3 +117,62 @@ style_list = [
         "prompt": "{prompt}, Victorian gothic style, dark romanticism, ornate Victorian architecture, elegant yet eerie, lace, velvet, and deep red tones, mysterious ambiance, heavy use of shadows, vintage clothing with a gothic twist, haunted, brooding atmosphere",
     },
 ]
+
+# Lookup tables built once at import so requests never scan or parse the lists above.
+
+DEFAULT_STYLE = "(None)"
+CUSTOM_ASPECT_RATIO = "Custom"
+
+# Must match the width/height sliders in app.py
+MIN_DIMENSION = 256
+MAX_DIMENSION = 1440
+DIMENSION_STEP = 16
+
+
+def _compile_template(template):
+    """Split a style template around its {prompt} placeholders so applying it is a single join."""
+    if "{prompt}" not in template:
+        raise ValueError(f"Style template has no {{prompt}} placeholder: {template!r}")
+    return tuple(template.split("{prompt}"))
+
+
+def parse_aspect_ratio(label):
+    """Parse a "W x H" label into a validated (width, height) tuple."""
+    try:
+        width, height = (int(part) for part in label.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Aspect ratio must look like 'W x H', got {label!r}") from None
+    for value in (width, height):
+        if not MIN_DIMENSION <= value <= MAX_DIMENSION or value % DIMENSION_STEP:
+            raise ValueError(
+                f"Aspect ratio {label!r} is outside {MIN_DIMENSION}-{MAX_DIMENSION} "
+                f"or not a multiple of {DIMENSION_STEP}"
+            )
+    return width, height
+
+
+STYLES = {style["name"]: _compile_template(style["prompt"]) for style in style_list}
+STYLE_NAMES = list(STYLES)
+
+# Presets the sliders cannot represent (e.g. 1536 x 640) are left out; "Custom" maps to None.
+ASPECT_RATIOS = {}
+for _label in aspect_ratios:
+    if _label == CUSTOM_ASPECT_RATIO:
+        ASPECT_RATIOS[_label] = None
+        continue
+    try:
+        ASPECT_RATIOS[_label] = parse_aspect_ratio(_label)
+    except ValueError:
+        pass
+del _label
+
+
+def apply_style(style_name, prompt):
+    """Expand a prompt with the named style; blank prompts are returned untouched."""
+    try:
+        parts = STYLES[style_name]
+    except KeyError:
+        raise ValueError(f"Unknown style: {style_name}") from None
+    if not prompt.strip():
+        return prompt
+    return prompt.join(parts)
@@ -0,0 +1,65 @@
+import base64
+import io
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from metrics import observe
+
+
+class GeneratedImage:
+    """An image payload that converts between base64, bytes and PIL only on demand.
+
+    The provider hands us base64; keeping that string lets the upload pass it
+    through untouched, while the raw bytes and the decoded PIL image are
+    materialized once, the first time something actually needs them.
+    """
+
+    __slots__ = ('_b64', '_data', '_image')
+
+    def __init__(self, b64: Optional[str] = None, data: Optional[bytes] = None):
+        if b64 is None and data is None:
+            raise ValueError("GeneratedImage needs base64 or raw bytes")
+        self._b64 = b64
+        self._data = data
+        self._image: Optional[Image.Image] = None
+
+    @classmethod
+    def from_b64(cls, b64: str) -> 'GeneratedImage':
+        return cls(b64=b64)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'GeneratedImage':
+        return cls(data=data)
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self._data).decode('ascii')
+        return self._b64
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            with observe('b64_decode'):
+                self._data = base64.b64decode(self._b64)
+        return self._data
+
+    @property
+    def image(self) -> Image.Image:
+        """Decode to PIL for display; ``BytesIO`` wraps the bytes without copying them."""
+        if self._image is None:
+            data = self.data
+            with observe('pil_open'):
+                self._image = Image.open(io.BytesIO(data))
+        return self._image
+
+    def upload_part(self) -> Tuple[Optional[str], object]:
+        """Return a ``(filename, content)`` multipart part for the ``image`` field.
+
+        The provider's base64 is sent as-is as a plain form field; raw bytes
+        go out as a binary file part. Neither path re-encodes the image.
+        """
+        if self._b64 is not None:
+            return None, self._b64
+        return 'image.png', self._data
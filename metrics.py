@@ -0,0 +1,118 @@
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "flux"
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "False").lower() == "true"
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("flux-generator") if TRACING_ENABLED else None
+except ImportError:
+    _tracer = None
+    if TRACING_ENABLED:
+        logger.warning("TRACING_ENABLED is set but opentelemetry is not installed; spans are disabled")
+
+STAGE_SECONDS = Histogram(
+    f"{PREFIX}_stage_duration_seconds",
+    "Duration of each generation pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+ERRORS = Counter(f"{PREFIX}_errors", "Errors raised per pipeline stage", ["stage"])
+IN_FLIGHT = Gauge(f"{PREFIX}_requests_in_flight", "Generation requests currently being handled")
+
+
+def span(name: str, **attributes):
+    """Start an OpenTelemetry span when tracing is enabled, otherwise do nothing."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def start_span(name: str, **attributes):
+    """Start a detached span covering a whole request; pair with ``end_span``.
+
+    Streaming handlers yield across event-loop turns, so the request span is
+    not made current and stage spans are recorded alongside it.
+    """
+    if _tracer is None:
+        return None
+    return _tracer.start_span(name, attributes=attributes or None)
+
+
+def end_span(request_span, error: Optional[BaseException] = None):
+    if request_span is None:
+        return
+    if error is not None:
+        request_span.record_exception(error)
+    request_span.end()
+
+
+@contextmanager
+def observe(stage: str):
+    """Time a pipeline stage into the stage histogram, counting it as an error if it raises."""
+    start = time.perf_counter()
+    with span(stage):
+        try:
+            yield
+        except Exception:
+            ERRORS.labels(stage).inc()
+            raise
+        finally:
+            STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+class StatsCollector:
+    """Expose the ``stats()`` snapshots of the app's subsystems as Prometheus metrics.
+
+    Each source returns a flat ``{key: number}`` dict, or ``{label_value: {key: number}}``
+    when registered with a ``label``. Keys listed in ``counters`` are exported as
+    counters, every other numeric value as a gauge.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, tuple] = {}
+
+    def register(self, name: str, source: Callable[[], dict], counters: Iterable[str] = (),
+                 label: Optional[str] = None):
+        self._sources[name] = (source, frozenset(counters), label)
+
+    def collect(self):
+        for name, (source, counters, label) in list(self._sources.items()):
+            try:
+                snapshot = source()
+            except Exception as e:
+                logger.warning(f"Could not collect {name} stats: {e}")
+                continue
+            rows = snapshot.items() if label else [(None, snapshot)]
+            families = {}
+            for label_value, stats in rows:
+                for key, value in stats.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    family = families.get(key)
+                    if family is None:
+                        metric_cls = CounterMetricFamily if key in counters else GaugeMetricFamily
+                        family = families[key] = metric_cls(
+                            f"{PREFIX}_{name}_{key}", f"{name} {key.replace('_', ' ')}",
+                            labels=[label] if label else None,
+                        )
+                    family.add_metric([label_value] if label else [], value)
+            yield from families.values()
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def render() -> tuple:
+    """Return the exposition payload and content type for a /metrics response."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
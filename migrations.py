@@ -0,0 +1,244 @@
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Tuple, Union
+
+if TYPE_CHECKING:
+    from db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock, so replicas booting together migrate one at a time.
+MIGRATION_LOCK_ID = 7_860_001
+LOCK_POLL_INTERVAL = 1.0
+BACKFILL_BATCH_SIZE = 1000
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    # SQL strings, or callables taking the cursor for steps SQL cannot do alone
+    statements: Tuple[Union[str, Callable], ...]
+    # False runs each statement in autocommit, as CREATE/DROP INDEX CONCURRENTLY require.
+    transactional: bool = True
+    # Rewrites or copies a whole table; skipped at boot and applied by ``python migrations.py``.
+    # Boot may apply later online migrations first, so those must not depend on an offline one.
+    offline: bool = False
+
+
+def _move_raw_responses(cursor):
+    """Copy inline raw_response text into the side table, compressed the way the app writes it."""
+    import json
+    from psycopg2.extras import execute_values
+    from raw_response import encode_response
+    last_id = 0
+    while True:
+        cursor.execute(
+            'SELECT id, raw_response FROM generated_images WHERE raw_response IS NOT NULL AND id > %s '
+            'ORDER BY id LIMIT %s',
+            (last_id, BACKFILL_BATCH_SIZE),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        execute_values(
+            cursor,
+            'INSERT INTO generated_image_responses (image_id, raw_response) VALUES %s ON CONFLICT (image_id) DO NOTHING',
+            [(row_id, encode_response(json.loads(raw))) for row_id, raw in rows],
+        )
+        last_id = rows[-1][0]
+
+
+# A failed CONCURRENTLY build leaves an INVALID index that IF NOT EXISTS would keep; drop those first.
+DROP_INVALID_INDEXES = '''
+DO $$
+DECLARE invalid RECORD;
+BEGIN
+    FOR invalid IN SELECT indexrelid::regclass AS name FROM pg_index
+                   WHERE indrelid = 'generated_images'::regclass AND NOT indisvalid LOOP
+        EXECUTE format('DROP INDEX %s', invalid.name);
+    END LOOP;
+END
+$$
+'''
+
+# Append new migrations; never edit an applied one.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create generated_images", (
+        '''
+        CREATE TABLE IF NOT EXISTS generated_images (
+            id SERIAL PRIMARY KEY,
+            generation_prompt TEXT NOT NULL,
+            generation_timestamp TIMESTAMP NOT NULL,
+            generation_width INT NOT NULL,
+            generation_height INT NOT NULL,
+            generation_steps INT NOT NULL,
+            imgbb_id VARCHAR(255) NOT NULL,
+            imgbb_title VARCHAR(255),
+            imgbb_url_viewer TEXT,
+            imgbb_url TEXT,
+            imgbb_display_url TEXT,
+            imgbb_width VARCHAR(50),
+            imgbb_height VARCHAR(50),
+            imgbb_size VARCHAR(50),
+            imgbb_time VARCHAR(50),
+            imgbb_expiration VARCHAR(50),
+            delete_url TEXT,
+            raw_response TEXT,
+            user_id VARCHAR(255)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_timestamp ON generated_images (generation_timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_imgbb_id ON generated_images (imgbb_id)',
+    )),
+    Migration(2, "gallery read indexes", (
+        DROP_INVALID_INDEXES,
+        # Keyset pagination order; supersedes the single-column timestamp index.
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_timestamp_id ON generated_images (generation_timestamp DESC, id DESC)',
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_timestamp',
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_dimensions_steps ON generated_images
+            (generation_width, generation_height, generation_steps, generation_timestamp DESC, id DESC)
+        ''',
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prompt_fts ON generated_images
+            USING GIN (to_tsvector('english', generation_prompt))
+        ''',
+    ), transactional=False),
+    Migration(3, "side table for raw responses", (
+        # Rows hold raw_response.encode_response output: zlib-compressed JSON.
+        '''
+        CREATE TABLE IF NOT EXISTS generated_image_responses (
+            image_id INT PRIMARY KEY REFERENCES generated_images (id) ON DELETE CASCADE,
+            raw_response BYTEA NOT NULL
+        )
+        ''',
+        # Already compressed, so TOAST should not spend time trying again on the rare large one.
+        'ALTER TABLE generated_image_responses ALTER COLUMN raw_response SET STORAGE EXTERNAL',
+    )),
+    Migration(4, "derivative image urls", (
+        # Nullable columns without a default are a catalog-only change.
+        '''
+        ALTER TABLE generated_images
+            ADD COLUMN IF NOT EXISTS thumbnail_url TEXT,
+            ADD COLUMN IF NOT EXISTS preview_url TEXT
+        ''',
+    )),
+    Migration(5, "integer imgbb dimensions", (
+        # Rewrites the table under ACCESS EXCLUSIVE. Values that are not plain digits become NULL.
+        '''
+        ALTER TABLE generated_images
+            ALTER COLUMN imgbb_width TYPE INT
+                USING CASE WHEN imgbb_width ~ '^[0-9]+$' THEN imgbb_width::INT END,
+            ALTER COLUMN imgbb_height TYPE INT
+                USING CASE WHEN imgbb_height ~ '^[0-9]+$' THEN imgbb_height::INT END,
+            ALTER COLUMN imgbb_size TYPE BIGINT
+                USING CASE WHEN imgbb_size ~ '^[0-9]+$' THEN imgbb_size::BIGINT END
+        ''',
+    ), offline=True),
+    Migration(6, "move existing raw responses to the side table", (
+        # New rows already go to generated_image_responses; this copies the old ones over.
+        _move_raw_responses,
+        # Space held by the dropped column is reclaimed by the next table rewrite (VACUUM FULL / pg_repack).
+        'ALTER TABLE generated_images DROP COLUMN IF EXISTS raw_response',
+    ), offline=True),
+    Migration(7, "unique imgbb_id", (
+        DROP_INVALID_INDEXES,
+        # Duplicates written by retried persistence jobs; keep the first copy of each image.
+        'DELETE FROM generated_images later USING generated_images first '
+        'WHERE later.imgbb_id = first.imgbb_id AND later.id > first.id',
+        # Inserts use ON CONFLICT DO NOTHING, so once this exists a retried job cannot add a row twice.
+        'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_imgbb_id_unique ON generated_images (imgbb_id)',
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_imgbb_id',
+    ), transactional=False),
+]
+
+
+def _applied_versions(cursor) -> set:
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return set()
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _apply(connection, migration: Migration):
+    logger.info(f"Applying schema migration {migration.version}: {migration.description}")
+    connection.autocommit = not migration.transactional
+    try:
+        with connection.cursor() as cursor:
+            for statement in migration.statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(
+                'INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+                (migration.version, migration.description),
+            )
+        if migration.transactional:
+            connection.commit()
+    finally:
+        if not migration.transactional:
+            connection.autocommit = False
+
+
+def migrate(pool: 'ConnectionPool', migrations=MIGRATIONS, offline: bool = False) -> List[int]:
+    """Apply pending migrations, each in its own transaction, and return the versions applied.
+
+    Offline migrations are only applied when ``offline`` is true. An up-to-date
+    schema costs two cheap reads and takes no locks, so every boot can call
+    this. Otherwise a session advisory lock serializes concurrent boots and
+    the applied set is re-read under it.
+    """
+    wanted = sorted((m for m in migrations if offline or not m.offline), key=lambda m: m.version)
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            applied = _applied_versions(cursor)
+        connection.commit()
+        skipped = [m.version for m in migrations if m.offline and not offline and m.version not in applied]
+        if skipped:
+            logger.warning(f"Offline schema migration(s) {skipped} pending; "
+                           f"run `python migrations.py` in a maintenance window")
+        if all(m.version in applied for m in wanted):
+            return []
+
+        done = []
+        # Poll rather than block: a session waiting inside pg_advisory_lock holds a snapshot, and
+        # CREATE INDEX CONCURRENTLY in the session holding the lock would wait for it forever.
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+                locked = cursor.fetchone()[0]
+            connection.commit()
+            if locked:
+                break
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now()
+                )
+                ''')
+                applied = _applied_versions(cursor)
+            connection.commit()
+            for migration in wanted:
+                if migration.version not in applied:
+                    _apply(connection, migration)
+                    done.append(migration.version)
+        finally:
+            # A failed statement aborts the transaction, which must end before the unlock can run.
+            connection.rollback()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+            connection.commit()
+        return done
+
+
+if __name__ == '__main__':
+    # Offline job: apply every pending migration, including the ones boot skips.
+    import app
+    applied = migrate(app.get_db_pool(), offline=True)
+    print(f"Applied schema migration(s) {applied}" if applied else "Database schema is up to date")
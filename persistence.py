@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from resilience import classify
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class PersistenceJob:
+    """A batch of generated images waiting to be uploaded and recorded together."""
+    prompt: str
+    width: int
+    height: int
+    steps: int
+    images_b64: List[str] = field(repr=False)
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.time)
+    attempts: int = 0
+    upload_responses: List[Optional[dict]] = field(default_factory=list, repr=False)
+    # Rows already committed, so a retried job only inserts the rest
+    saved: List[bool] = field(default_factory=list, repr=False)
+
+    def __post_init__(self):
+        if not self.upload_responses:
+            self.upload_responses = [None] * len(self.images_b64)
+        if not self.saved:
+            self.saved = [False] * len(self.images_b64)
+
+    def metadata(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'prompt': self.prompt,
+            'width': self.width,
+            'height': self.height,
+            'steps': self.steps,
+            'created_at': self.created_at,
+            'attempts': self.attempts,
+        }
+
+
+# process(job, report) performs the uploads/inserts and returns the image URLs;
+# report(state) publishes progress.
+ProcessFn = Callable[[PersistenceJob, Callable[[str], None]], List[Optional[str]]]
+
+
+class PersistenceQueue:
+    """Bounded write-behind queue that persists generated images off the request path.
+
+    Every submitted job is spooled to disk before it is acknowledged and removed
+    only once it has been processed, so pending work survives a restart
+    (delivery is at-least-once). Only errors ``resilience.classify`` deems
+    retryable are retried; the upload and save calls already retry on their
+    own, so this covers outages that outlast them. Jobs that fail otherwise
+    or exhaust their attempts are moved to ``<spool_dir>/failed`` for manual
+    replay.
+    """
+
+    def __init__(self, process: ProcessFn, spool_dir: str, maxsize: int = 100,
+                 workers: int = 4, enqueue_timeout: float = 2.0,
+                 max_attempts: int = 3, status_history: int = 1000):
+        self._process = process
+        self._spool_dir = spool_dir
+        self._failed_dir = os.path.join(spool_dir, 'failed')
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._num_workers = workers
+        self._enqueue_timeout = enqueue_timeout
+        self._max_attempts = max_attempts
+        self._status_history = status_history
+        self._statuses: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: list = []
+        os.makedirs(self._failed_dir, exist_ok=True)
+
+    # Spool handling
+
+    def _spool_paths(self, job_id: str, directory: Optional[str] = None) -> tuple:
+        directory = directory or self._spool_dir
+        return os.path.join(directory, f"{job_id}.json"), os.path.join(directory, f"{job_id}.b64")
+
+    def _spool(self, job: PersistenceJob):
+        meta_path, image_path = self._spool_paths(job.job_id)
+        # Write the image first: a metadata file marks the job as committed.
+        # Base64 never contains a newline, so one image per line is unambiguous.
+        images = "\n".join(job.images_b64)
+        for path, data in ((image_path, images), (meta_path, json.dumps(job.metadata()))):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+    def _unspool(self, job: PersistenceJob, failed: bool = False):
+        for src in self._spool_paths(job.job_id):
+            try:
+                if failed:
+                    os.replace(src, os.path.join(self._failed_dir, os.path.basename(src)))
+                else:
+                    os.remove(src)
+            except FileNotFoundError:
+                pass
+
+    def _recover(self):
+        """Re-enqueue jobs left in the spool by a previous process."""
+        recovered = 0
+        for name in sorted(os.listdir(self._spool_dir)):
+            if not name.endswith('.json'):
+                continue
+            meta_path, image_path = self._spool_paths(name[:-len('.json')])
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                with open(image_path) as f:
+                    images_b64 = f.read().split("\n")
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping unreadable spooled job {name}: {e}")
+                continue
+            job = PersistenceJob(images_b64=images_b64, **meta)
+            self._set_status(job.job_id, 'queued')
+            self._queue.put(job)
+            recovered += 1
+        if recovered:
+            logger.info(f"Recovered {recovered} spooled persistence job(s)")
+
+    # Status tracking
+
+    def _set_status(self, job_id: str, state: str, **details):
+        now = time.time()
+        with self._lock:
+            entry = self._statuses.pop(job_id, {})
+            # Accumulate time spent per stage ("uploading 1/2" counts as "uploading").
+            if 'state' in entry:
+                stage = entry['state'].split()[0]
+                timings = entry.setdefault('timings', {})
+                timings[stage] = timings.get(stage, 0.0) + now - entry['updated_at']
+            entry.update(details, state=state, updated_at=now)
+            self._statuses[job_id] = entry
+            while len(self._statuses) > self._status_history:
+                self._statuses.popitem(last=False)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Return the latest state of a job, with seconds spent per finished stage, or None."""
+        with self._lock:
+            entry = self._statuses.get(job_id)
+            if entry is None:
+                return None
+            snapshot = dict(entry)
+            snapshot['timings'] = dict(entry.get('timings', {}))
+            return snapshot
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # Lifecycle
+
+    def start(self):
+        """Start the worker threads and replay any spooled jobs."""
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._worker, name=f"persistence-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._recover, name="persistence-recover", daemon=True).start()
+
+    def stop(self, timeout: float = 30.0):
+        """Let the workers drain in-flight jobs; anything left stays spooled."""
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, prompt: str, width: int, height: int, steps: int, images_b64: List[str]) -> str:
+        """Spool and enqueue a job, returning its id.
+
+        Raises ``queue.Full`` if the queue stays full for ``enqueue_timeout``
+        seconds so the caller can apply backpressure.
+        """
+        job = PersistenceJob(prompt=prompt, width=width, height=height, steps=steps,
+                             images_b64=list(images_b64))
+        self._spool(job)
+        self._set_status(job.job_id, 'queued')
+        try:
+            self._queue.put(job, timeout=self._enqueue_timeout)
+        except queue.Full:
+            self._unspool(job)
+            with self._lock:
+                self._statuses.pop(job.job_id, None)
+            raise
+        return job.job_id
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: PersistenceJob):
+        job.attempts += 1
+        try:
+            result = self._process(job, lambda state: self._set_status(job.job_id, state))
+        except Exception as e:
+            # Fatal errors (bad input, a 4xx, an open circuit) would fail the same way again.
+            retryable, _ = classify(e)
+            if retryable and job.attempts < self._max_attempts:
+                logger.warning(f"Persistence job {job.job_id} failed (attempt {job.attempts}): {e}")
+                self._set_status(job.job_id, 'retrying', error=str(e))
+                timer = threading.Timer(2 ** job.attempts, self._queue.put, args=(job,))
+                timer.daemon = True
+                timer.start()
+            else:
+                logger.error(f"Persistence job {job.job_id} failed permanently: {e}")
+                self._set_status(job.job_id, 'failed', error=str(e))
+                self._unspool(job, failed=True)
+            return
+        self._set_status(job.job_id, 'done', urls=result, error=None)
+        self._unspool(job)
@@ -0,0 +1,16 @@
+import json
+import zlib
+
+# ImgBB responses are ~750 bytes of JSON, under PostgreSQL's ~2 KB TOAST threshold,
+# so the server never compresses them; zlib in the app shrinks them about 3x.
+COMPRESSION_LEVEL = 6
+
+
+def encode_response(response: dict) -> bytes:
+    """Compact, zlib-compressed JSON for ``generated_image_responses.raw_response``."""
+    return zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decode_response(data: bytes) -> dict:
+    """Inverse of ``encode_response``."""
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
@@ -0,0 +1,237 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Errors raised by our own code or by bad input; retrying them cannot help.
+FATAL_EXCEPTIONS = (ValueError, TypeError, KeyError, AttributeError, NotImplementedError)
+
+_breakers: Dict[str, 'CircuitBreaker'] = {}
+_retry_counts: Counter = Counter()
+_retry_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is temporarily unavailable, please try again in {retry_in:.0f} seconds")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given as delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _status_and_headers(exc: BaseException) -> Tuple[Optional[int], dict]:
+    """Pull an HTTP status and headers out of requests, httpx or Together errors."""
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    headers = getattr(response, 'headers', None)
+    if status is None:
+        status = getattr(exc, 'http_status', None) or getattr(exc, 'status_code', None)
+    if headers is None:
+        headers = getattr(exc, 'headers', None)
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+    return status, headers or {}
+
+
+def classify(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """Return ``(retryable, retry_after)`` for an exception raised by an upstream call."""
+    if isinstance(exc, CircuitOpenError):
+        return False, None
+    status, headers = _status_and_headers(exc)
+    if status is not None:
+        retry_after = parse_retry_after(headers.get('Retry-After') or headers.get('retry-after'))
+        return status in RETRYABLE_STATUSES, retry_after
+    if isinstance(exc, FATAL_EXCEPTIONS):
+        return False, None
+    # No status: connection resets, timeouts and similar transport failures.
+    return True, None
+
+
+class CircuitBreaker:
+    """Per-upstream circuit breaker.
+
+    After ``failure_threshold`` consecutive retryable failures the breaker
+    opens and calls fail fast for ``reset_timeout`` seconds. It then lets a
+    single probe through (half-open); success closes it, failure reopens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    # Numeric encoding of the state for metrics
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {'opened': 0, 'rejected': 0, 'successes': 0, 'failures': 0}
+        _breakers[name] = self
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` if the call should not reach the upstream."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if self._state == self.OPEN and remaining <= 0:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._stats['rejected'] += 1
+            raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, counts: bool = True):
+        """Record a failed call; only ``counts=True`` failures move the breaker."""
+        with self._lock:
+            self._probe_in_flight = False
+            if not counts:
+                return
+            self._stats['failures'] += 1
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self._failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats['opened'] += 1
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failure(s)")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(state=self._state, state_value=self.STATE_VALUES[self._state],
+                            consecutive_failures=self._failures)
+        return snapshot
+
+
+def breaker_states() -> Dict[str, dict]:
+    """Return the current state and counters of every circuit breaker."""
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
+
+
+def retry_counts() -> Dict[str, int]:
+    """Return the number of retries performed per upstream."""
+    with _retry_lock:
+        return dict(_retry_counts)
+
+
+def _next_delay(previous: float, base_delay: float, max_delay: float) -> float:
+    """Decorrelated jitter: sleep somewhere between the base and 3x the last sleep."""
+    return min(max_delay, random.uniform(base_delay, previous * 3))
+
+
+def _plan_retry(breaker: CircuitBreaker, exc: Exception, attempt: int, max_attempts: int,
+                delay: float, base_delay: float, max_delay: float) -> Optional[float]:
+    """Record the failure and return how long to wait, or None to re-raise."""
+    retryable, retry_after = classify(exc)
+    if not isinstance(exc, CircuitOpenError):
+        breaker.record_failure(counts=retryable)
+    if not retryable or attempt == max_attempts - 1:
+        return None
+    wait = _next_delay(delay, base_delay, max_delay)
+    if retry_after is not None:
+        if retry_after > max_delay:
+            logger.warning(f"{breaker.name} asked us to wait {retry_after:.0f}s, giving up instead")
+            return None
+        wait = max(wait, retry_after)
+    with _retry_lock:
+        _retry_counts[breaker.name] += 1
+    logger.warning(f"{breaker.name} attempt {attempt + 1} failed ({exc}), retrying in {wait:.2f} seconds...")
+    return wait
+
+
+def retry_with_backoff(breaker: CircuitBreaker, max_attempts: int = 3,
+                       base_delay: float = 1.0, max_delay: float = 30.0):
+    """Retry retryable failures with decorrelated jitter behind ``breaker``.
+
+    The wrapped call must not retry on its own (build SDK clients with
+    ``max_retries=0``), or every attempt here fans out into several upstream calls.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            delay = base_delay
+            for attempt in range(max_attempts):
+                breaker.before_call()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    wait = _plan_retry(breaker, e, attempt, max_attempts, delay, base_delay, max_delay)
+                    if wait is None:
+                        raise
+                    delay = wait
+                    time.sleep(wait)
+                    continue
+                breaker.record_success()
+                return result
+        return wrapper
+    return decorator
+
+
+def async_retry_with_backoff(breaker: CircuitBreaker, max_attempts: int = 3,
+                             base_delay: float = 1.0, max_delay: float = 30.0):
+    """Coroutine counterpart of ``retry_with_backoff``."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            delay = base_delay
+            for attempt in range(max_attempts):
+                breaker.before_call()
+                try:
+                    result = await func(*args, **kwargs)
+                except asyncio.CancelledError:
+                    breaker.record_failure(counts=False)
+                    raise
+                except Exception as e:
+                    wait = _plan_retry(breaker, e, attempt, max_attempts, delay, base_delay, max_delay)
+                    if wait is None:
+                        raise
+                    delay = wait
+                    await asyncio.sleep(wait)
+                    continue
+                breaker.record_success()
+                return result
+        return wrapper
+    return decorator
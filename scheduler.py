@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away instead of being queued."""
+
+
+class RateLimited(AdmissionRejected):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many requests, please try again in {retry_after:.0f} seconds.")
+        self.retry_after = retry_after
+
+
+class Overloaded(AdmissionRejected):
+    pass
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, holding at most ``burst``."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token; return 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+class Ticket:
+    """A client's place in the admission queue."""
+
+    __slots__ = ('client_id', 'enqueued_at', 'granted', 'released', '_event')
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.released = False
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for a slot; return whether one was granted."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.granted
+
+    def _grant(self):
+        self.granted = True
+        self._event.set()
+
+
+class AdmissionController:
+    """Global concurrency cap with per-client rate limits and a bounded FIFO.
+
+    ``enter`` either grants a slot right away, queues the request, or raises
+    ``AdmissionRejected`` immediately when the client is over its rate limit,
+    already has ``max_per_client`` requests in the system, or the queue is full.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, rate: float, burst: float,
+                 max_per_client: int = 2, max_buckets: int = 10000):
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._rate = rate
+        self._burst = burst
+        self._max_per_client = max_per_client
+        self._max_buckets = max_buckets
+        self._running = 0
+        self._waiting: deque = deque()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._per_client: Dict[str, int] = {}
+        self._stats = {'admitted': 0, 'queued': 0, 'rate_limited': 0, 'overloaded': 0, 'timed_out': 0}
+
+    def _bucket(self, client_id: str) -> TokenBucket:
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            if len(self._buckets) >= self._max_buckets:
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.is_idle()}
+            bucket = self._buckets[client_id] = TokenBucket(self._rate, self._burst)
+        return bucket
+
+    def enter(self, client_id: str) -> Ticket:
+        """Admit or enqueue a request, or raise ``AdmissionRejected``."""
+        if self._per_client.get(client_id, 0) >= self._max_per_client:
+            self._stats['rate_limited'] += 1
+            raise RateLimited(retry_after=1)
+        runnable = self._running < self._max_concurrency and not self._waiting
+        # Checked before taking a token, so a request bounced for capacity costs the client no rate budget.
+        if not runnable and len(self._waiting) >= self._max_queue:
+            self._stats['overloaded'] += 1
+            raise Overloaded("The generator is at capacity right now, please try again shortly.")
+        retry_after = self._bucket(client_id).try_acquire()
+        if retry_after:
+            self._stats['rate_limited'] += 1
+            raise RateLimited(retry_after=retry_after)
+        ticket = Ticket(client_id)
+        if runnable:
+            self._running += 1
+            ticket._grant()
+        else:
+            self._waiting.append(ticket)
+            self._stats['queued'] += 1
+        self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+        self._stats['admitted'] += 1
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based position in the queue, or 0 once the ticket holds a slot."""
+        if ticket.granted:
+            return 0
+        try:
+            return self._waiting.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def queue_length(self) -> int:
+        return len(self._waiting)
+
+    def release(self, ticket: Ticket, timed_out: bool = False):
+        """Give back a slot (or a queue place) and hand it to the next waiter; idempotent."""
+        if ticket.released:
+            return
+        ticket.released = True
+        remaining = self._per_client.get(ticket.client_id, 1) - 1
+        if remaining:
+            self._per_client[ticket.client_id] = remaining
+        else:
+            self._per_client.pop(ticket.client_id, None)
+        if timed_out:
+            self._stats['timed_out'] += 1
+        if not ticket.granted:
+            try:
+                self._waiting.remove(ticket)
+            except ValueError:
+                pass
+            return
+        self._running -= 1
+        while self._waiting and self._running < self._max_concurrency:
+            self._running += 1
+            self._waiting.popleft()._grant()
+
+    def stats(self) -> dict:
+        snapshot = dict(self._stats)
+        snapshot.update(running=self._running, waiting=len(self._waiting))
+        return snapshot
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+
+from image_payload import GeneratedImage
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'RIFF', 'webp'),
+)
+
+
+def guess_extension(data: bytes) -> str:
+    """Pick a file extension from the image's magic bytes, defaulting to png."""
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return 'png'
+
+
+class StorageBackend(ABC):
+    """Where generated images and their derivatives are kept.
+
+    ``upload`` returns a response shaped like ImgBB's (``{'data': {'id', 'url',
+    'display_url', 'width', 'height', 'size', ...}}``) so gallery rows are
+    filled the same way whichever backend is active.
+    """
+
+    name = "storage"
+
+    @abstractmethod
+    def upload(self, image: GeneratedImage) -> dict:
+        """Store a generated image and return the ImgBB-shaped response."""
+
+    async def upload_async(self, image: GeneratedImage) -> dict:
+        return await asyncio.to_thread(self.upload, image)
+
+    def derivative_urls(self, response: dict) -> Optional[dict]:
+        """``{kind: url}`` renditions the backend made itself during ``upload``, or None if they must be rendered."""
+        return None
+
+    @abstractmethod
+    def put_derivative(self, image_id: str, kind: str, data: bytes, extension: str) -> str:
+        """Store a derived rendition of an uploaded image and return its URL."""
+
+
+class ImgBBStorage(StorageBackend):
+    """Uploads through the app's ImgBB client functions, which carry the retries and circuit breaker."""
+
+    name = "ImgBB"
+
+    def __init__(self, upload: Callable[[GeneratedImage], dict],
+                 upload_async: Callable[[GeneratedImage], Awaitable[dict]]):
+        self._upload = upload
+        self._upload_async = upload_async
+
+    def upload(self, image: GeneratedImage) -> dict:
+        return self._upload(image)
+
+    async def upload_async(self, image: GeneratedImage) -> dict:
+        return await self._upload_async(image)
+
+    def derivative_urls(self, response: dict) -> dict:
+        # ImgBB already returns a thumbnail and a medium rendition; re-uploading our own would cost extra calls.
+        data = response['data']
+        return {
+            'thumbnail': (data.get('thumb') or {}).get('url'),
+            'preview': (data.get('medium') or {}).get('url'),
+        }
+
+    def put_derivative(self, image_id: str, kind: str, data: bytes, extension: str) -> str:
+        # Not reached by the app, since derivative_urls always answers; kept for completeness.
+        return self._upload(GeneratedImage.from_bytes(data))['data'].get('url')
+
+
+class LocalStorage(StorageBackend):
+    """Writes images under ``directory`` and links them below ``base_url``.
+
+    Files are sharded by the first two characters of their id to keep
+    directories small, and written atomically so a reader never sees a
+    partial image. The app serves ``directory`` itself when this backend is
+    active; point ``base_url`` at a CDN or reverse proxy to offload that.
+    """
+
+    name = "local storage"
+
+    def __init__(self, directory: str, base_url: str):
+        self._directory = directory
+        self._base_url = base_url.rstrip('/')
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, name: str, data: bytes) -> str:
+        relative = f"{name[:2]}/{name}"
+        path = os.path.join(self._directory, name[:2], name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return f"{self._base_url}/{relative}"
+
+    def upload(self, image: GeneratedImage) -> dict:
+        image_id = uuid.uuid4().hex
+        data = image.data
+        with observe('local_store'):
+            url = self._write(f"{image_id}.{guess_extension(data)}", data)
+        width, height = image.image.size
+        logger.info("Stored image locally")
+        return {
+            'data': {
+                'id': image_id,
+                'title': image_id,
+                'url_viewer': url,
+                'url': url,
+                'display_url': url,
+                'width': width,
+                'height': height,
+                'size': len(data),
+                'time': str(int(time.time())),
+                'expiration': '0',
+                'delete_url': None,
+            },
+            'success': True,
+            'status': 200,
+        }
+
+    def put_derivative(self, image_id: str, kind: str, data: bytes, extension: str) -> str:
+        return self._write(f"{image_id}_{kind}.{extension}", data)
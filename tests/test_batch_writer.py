@@ -0,0 +1,117 @@
+import time
+
+import psycopg2
+import pytest
+
+from batch_writer import BatchWriter
+
+
+class RecordingWriter(BatchWriter):
+    """Keeps written batches in memory and rejects any batch holding a row in ``bad_rows``."""
+
+    def __init__(self, bad_rows=(), error=psycopg2.IntegrityError, **kwargs):
+        self.batches = []
+        self.attempts = 0
+        self.bad_rows = set(bad_rows)
+        self.error = error
+        super().__init__(pool=None, insert_sql='INSERT ... VALUES %s', **kwargs)
+
+    def _write_rows(self, rows):
+        self.attempts += 1
+        if self.bad_rows.intersection(rows):
+            raise self.error("bad row")
+        self.batches.append(list(rows))
+
+
+def test_flushes_when_batch_is_full():
+    writer = RecordingWriter(max_batch_size=3, max_delay=60)
+    try:
+        futures = writer.add_many([(1,), (2,), (3,)])
+        assert all(future.result(timeout=5) for future in futures)
+        assert writer.batches == [[(1,), (2,), (3,)]]
+    finally:
+        writer.close()
+
+
+def test_flushes_single_row_after_max_delay():
+    writer = RecordingWriter(max_batch_size=100, max_delay=0.1)
+    try:
+        start = time.monotonic()
+        assert writer.add((1,)).result(timeout=5)
+        assert time.monotonic() - start >= 0.1
+        assert writer.batches == [[(1,)]]
+    finally:
+        writer.close()
+
+
+def test_close_flushes_pending_rows():
+    writer = RecordingWriter(max_batch_size=100, max_delay=60)
+    futures = writer.add_many([(1,), (2,)])
+    writer.close()
+    assert all(future.result(timeout=0) for future in futures)
+    assert writer.batches == [[(1,), (2,)]]
+    with pytest.raises(RuntimeError):
+        writer.add((3,))
+
+
+def test_failing_row_fails_only_its_own_future():
+    writer = RecordingWriter(bad_rows=[(3,)], max_batch_size=5, max_delay=60)
+    try:
+        futures = writer.add_many([(1,), (2,), (3,), (4,), (5,)])
+        with pytest.raises(psycopg2.IntegrityError):
+            futures[2].result(timeout=5)
+        assert all(futures[i].result(timeout=5) for i in (0, 1, 3, 4))
+        assert sorted(row for batch in writer.batches for row in batch) == [(1,), (2,), (4,), (5,)]
+        stats = writer.stats()
+        assert (stats['rows'], stats['failed_rows'], stats['failed_batches']) == (4, 1, 1)
+    finally:
+        writer.close()
+
+
+def test_connection_error_fails_whole_batch_without_splitting():
+    writer = RecordingWriter(bad_rows=[(3,)], error=psycopg2.OperationalError, max_batch_size=5, max_delay=60)
+    try:
+        futures = writer.add_many([(1,), (2,), (3,), (4,), (5,)])
+        for future in futures:
+            with pytest.raises(psycopg2.OperationalError):
+                future.result(timeout=5)
+        assert writer.attempts == 1
+        assert writer.stats()['failed_rows'] == 5
+    finally:
+        writer.close()
+
+
+def test_side_values_follow_returned_keys(monkeypatch):
+    import contextlib
+    from psycopg2 import extras
+
+    calls = []
+
+    def fake_execute_values(cursor, sql, rows, page_size=None, fetch=False):
+        calls.append((sql, list(rows)))
+        if fetch:
+            # 'b' already exists (ON CONFLICT DO NOTHING) and the ids come back out of order.
+            return [(11, 'c'), (10, 'a')]
+
+    class Connection:
+        def cursor(self):
+            return contextlib.nullcontext()
+
+        def commit(self):
+            pass
+
+    class Pool:
+        @contextlib.contextmanager
+        def connection(self):
+            yield Connection()
+
+    monkeypatch.setattr(extras, 'execute_values', fake_execute_values)
+    writer = BatchWriter(Pool(), 'INSERT ... RETURNING id, key', side_insert_sql='INSERT side',
+                         max_batch_size=4, max_delay=60)
+    try:
+        futures = writer.add_many([(('a',), ('raw a',)), (('b',), ('raw b',)),
+                                   (('c',), ('raw c',)), (('c',), ('raw c again',))])
+        assert all(future.result(timeout=5) for future in futures)
+    finally:
+        writer.close()
+    assert calls[1] == ('INSERT side', [(10, 'raw a'), (11, 'raw c')])
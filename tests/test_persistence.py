@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from persistence import PersistenceQueue
+from resilience import CircuitOpenError
+
+
+def run_once(tmp_path, error: Exception):
+    attempts = []
+
+    def process(job, report):
+        attempts.append(job.job_id)
+        raise error
+
+    persistence_queue = PersistenceQueue(process, str(tmp_path), workers=1)
+    persistence_queue.start()
+    job_id = persistence_queue.submit("prompt", 512, 512, 4, ["aW1hZ2U="])
+    persistence_queue.stop()
+    return persistence_queue.status(job_id), attempts
+
+
+@pytest.mark.parametrize('error', [KeyError('data'), CircuitOpenError("ImgBB", 30)])
+def test_fatal_errors_fail_the_job_without_a_retry(tmp_path, error):
+    status, attempts = run_once(tmp_path, error)
+    assert status['state'] == 'failed'
+    assert len(attempts) == 1
+    assert sorted(os.listdir(tmp_path / 'failed')) == [f"{attempts[0]}.b64", f"{attempts[0]}.json"]
+
+
+def test_retryable_errors_are_requeued(tmp_path):
+    status, attempts = run_once(tmp_path, ConnectionError("reset"))
+    assert status['state'] == 'retrying'
+    assert os.path.exists(tmp_path / f"{attempts[0]}.json")
@@ -0,0 +1,18 @@
+import json
+import os
+import statistics
+import sys
+
+from raw_response import decode_response, encode_response
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from bench_raw_response import make_rows
+
+
+def test_round_trip_at_least_halves_responses():
+    responses = [json.loads(raw) for _, raw in make_rows(200)]
+    encoded = [encode_response(response) for response in responses]
+    assert [decode_response(data) for data in encoded] == responses
+    # Responses this small are never TOAST-compressed, so the app has to do it.
+    raw_sizes = [len(json.dumps(response, separators=(',', ':'))) for response in responses]
+    assert statistics.mean(map(len, encoded)) < statistics.mean(raw_sizes) / 2
@@ -0,0 +1,113 @@
+import asyncio
+import itertools
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, retry_with_backoff
+
+_names = itertools.count()
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, headers: dict = None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.headers = headers or {}
+
+
+def breaker(**kwargs) -> CircuitBreaker:
+    return CircuitBreaker(f"test-{next(_names)}", **kwargs)
+
+
+def flaky(errors: list):
+    """A callable raising each of ``errors`` in turn, then returning 'ok'."""
+    calls = []
+
+    def call():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return 'ok'
+    return call, calls
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(resilience.time, 'sleep', recorded.append)
+    return recorded
+
+
+def test_empty_prompt_is_not_retried(monkeypatch):
+    import app
+    sleeps = []
+
+    async def record_sleep(delay):
+        sleeps.append(delay)
+    monkeypatch.setattr(resilience.asyncio, 'sleep', record_sleep)
+    failures = app.together_breaker.snapshot()['failures']
+
+    with pytest.raises(ValueError, match="Please enter a prompt"):
+        asyncio.run(app.generate_images_async("   ", 512, 512, 4))
+    assert sleeps == []
+    assert app.together_breaker.snapshot()['failures'] == failures
+
+
+def test_retry_after_is_honoured(sleeps):
+    call, calls = flaky([HTTPError(429, {'Retry-After': '7'})])
+    wrapped = retry_with_backoff(breaker(), max_attempts=3, base_delay=0.1, max_delay=30)(call)
+    assert wrapped() == 'ok'
+    assert len(calls) == 2
+    assert len(sleeps) == 1 and sleeps[0] >= 7
+
+
+def test_retry_after_beyond_max_delay_gives_up(sleeps):
+    call, calls = flaky([HTTPError(503, {'Retry-After': '120'})])
+    wrapped = retry_with_backoff(breaker(), max_attempts=3, base_delay=0.1, max_delay=30)(call)
+    with pytest.raises(HTTPError):
+        wrapped()
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_breaker_opens_and_lets_one_probe_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    circuit = breaker(failure_threshold=3, reset_timeout=30)
+
+    for _ in range(2):
+        circuit.before_call()
+        circuit.record_failure()
+    assert circuit.snapshot()['state'] == CircuitBreaker.CLOSED
+    circuit.before_call()
+    circuit.record_failure()
+    assert circuit.snapshot()['state'] == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+
+    now[0] += 30
+    circuit.before_call()  # the probe
+    assert circuit.snapshot()['state'] == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+
+    circuit.record_failure()
+    assert circuit.snapshot()['state'] == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+
+    now[0] += 30
+    circuit.before_call()
+    circuit.record_success()
+    assert circuit.snapshot()['state'] == CircuitBreaker.CLOSED
+    circuit.before_call()
+
+
+def test_fatal_failures_do_not_open_the_breaker(sleeps):
+    circuit = breaker(failure_threshold=1)
+    call, calls = flaky([HTTPError(400)])
+    with pytest.raises(HTTPError):
+        retry_with_backoff(circuit, max_attempts=3)(call)()
+    assert len(calls) == 1
+    assert circuit.snapshot()['state'] == CircuitBreaker.CLOSED
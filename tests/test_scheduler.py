@@ -0,0 +1,84 @@
+import pytest
+
+from scheduler import AdmissionController, Overloaded, RateLimited
+
+
+def controller(**kwargs) -> AdmissionController:
+    options = dict(max_concurrency=1, max_queue=2, rate=1.0, burst=10, max_per_client=2)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_waiters_are_granted_in_fifo_order():
+    admission = controller(max_queue=3)
+    running = admission.enter('a')
+    first, second = admission.enter('b'), admission.enter('c')
+    assert running.granted and not first.granted and not second.granted
+
+    admission.release(running)
+    assert first.granted and not second.granted
+    admission.release(first)
+    assert second.granted
+
+
+def test_position_counts_from_the_head_of_the_queue():
+    admission = controller()
+    running = admission.enter('a')
+    first, second = admission.enter('b'), admission.enter('c')
+    assert [admission.position(t) for t in (running, first, second)] == [0, 1, 2]
+
+    admission.release(running)
+    assert [admission.position(t) for t in (first, second)] == [0, 1]
+
+
+def test_per_client_cap_rejects_until_a_request_finishes():
+    admission = controller(max_concurrency=2, max_per_client=2)
+    first = admission.enter('a')
+    admission.enter('a')
+    with pytest.raises(RateLimited):
+        admission.enter('a')
+    admission.enter('b')
+
+    admission.release(first)
+    admission.enter('a')
+
+
+def test_release_is_idempotent():
+    admission = controller(max_queue=3)
+    running = admission.enter('a')
+    waiting = [admission.enter('b'), admission.enter('c')]
+
+    admission.release(running)
+    admission.release(running)
+    assert admission.stats()['running'] == 1
+    assert waiting[0].granted and not waiting[1].granted
+
+
+def test_releasing_a_queued_ticket_frees_its_place():
+    admission = controller(max_queue=2)
+    running = admission.enter('a')
+    abandoned, behind = admission.enter('b'), admission.enter('c')
+
+    admission.release(abandoned, timed_out=True)
+    admission.release(abandoned, timed_out=True)
+    assert admission.queue_length() == 1
+    assert admission.position(behind) == 1
+    assert not abandoned.granted
+    assert admission.stats()['timed_out'] == 1
+
+    admission.release(running)
+    assert behind.granted and not abandoned.granted
+    assert admission.stats()['running'] == 1
+    admission.enter('b')  # the abandoned ticket no longer counts against its client
+
+
+def test_overloaded_requests_do_not_spend_rate_budget():
+    admission = controller(max_queue=0, burst=1, rate=0.001)
+    running = admission.enter('a')
+    for _ in range(3):
+        with pytest.raises(Overloaded):
+            admission.enter('b')
+
+    admission.release(running)
+    assert admission.enter('b').granted
+    assert admission.stats()['rate_limited'] == 0